@@ -0,0 +1,224 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import torch
+from transformers import StoppingCriteriaList
+from transformers.generation.streamers import BaseStreamer
+from chat import (
+    PromptCache, StopOnTokens, alpaca_prompt, cache_config, clean_response, generation_config, generation_kwargs,
+    has_merged_model, load_model, reset_stop_criteria,
+)
+from hardware import DTYPES, configure_cpu_threads, peak_rss_mb, select_device, select_dtype
+from qa_data import load_raw_data
+from reporting import csv_list, print_table
+from response_cache import ResponseCache, make_key
+from speculative import AnswerIndex, speculative_generate
+
+# --- HELPERS ---
+class FirstTokenTimer(BaseStreamer):
+    """Record when `generate` emits its first new token"""
+    def __init__(self):
+        self.first_token_time = None
+        self.seen_prompt = False
+
+    def put(self, value):
+        if not self.seen_prompt:
+            self.seen_prompt = True
+        elif self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+
+    def end(self):
+        pass
+
+def percentile(values, q):
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+def pick_questions(count):
+    """A fixed, evenly spread sample of training questions"""
+    questions = [item["text"] for item in load_raw_data()]
+    step = max(1, len(questions) // count)
+    return questions[::step][:count]
+
+# --- SINGLE CONFIGURATION ---
+def run_config(config, questions, repeats):
+    """Measure one inference configuration; runs in its own process so RSS and thread pools are isolated"""
+    device = config["device"]
+    dtype = select_dtype(device, config["dtype"])
+    if device == "cpu":
+        configure_cpu_threads(config["threads"])
+    torch.manual_seed(0)
+
+    start = time.perf_counter()
+    model, tokenizer = load_model(device, dtype, config["weights"])
+    load_seconds = time.perf_counter() - start
+
+    stop_criteria = StoppingCriteriaList([StopOnTokens(tokenizer)])
+    prompt_cache = PromptCache(model, tokenizer, alpaca_prompt.split("{}")[0]) if config["prompt_cache"] else None
+    answer_index = AnswerIndex(tokenizer, [item["output"] for item in load_raw_data()]) if config["speculative"] else None
+    response_cache = None
+    if config["response_cache"]:
+        # Every configuration starts with a cold cache
+        cache_dir = tempfile.mkdtemp()
+        response_cache = ResponseCache(os.path.join(cache_dir, "responses.sqlite"))
+    response_cache_config = cache_config()
+
+    def answer(batch):
+        """Returns (time to first token, new tokens) for one batch of questions"""
+        if response_cache is not None:
+            keys = [make_key(q, response_cache_config) for q in batch]
+            cached = [response_cache.get(key) for key in keys]
+            misses = [(q, key) for q, key, hit in zip(batch, keys, cached) if hit is None]
+            if not misses:
+                return time.perf_counter(), 0
+            batch = [q for q, _ in misses]
+
+        inputs = tokenizer([alpaca_prompt.format(q) for q in batch], return_tensors="pt", padding=True).to(model.device)
+        timer = FirstTokenTimer()
+        if answer_index is not None:
+            reset_stop_criteria(stop_criteria)
+            outputs = speculative_generate(model, inputs["input_ids"], answer_index, generation_config,
+                                           stop_criteria, prompt_cache, timer)
+        else:
+            with torch.no_grad():
+                outputs = model.generate(**inputs, streamer=timer,
+                                         **generation_kwargs(tokenizer, stop_criteria, inputs["input_ids"], prompt_cache))
+        generated = outputs[:, inputs["input_ids"].shape[1]:]
+
+        if response_cache is not None:
+            for (_, key), tokens in zip(misses, generated):
+                # Cached as chat.py caches it, so hits cost the same here as there
+                response_cache.put(key, clean_response(tokenizer.decode(tokens, skip_special_tokens=True)))
+        return timer.first_token_time, int((generated != tokenizer.pad_token_id).sum())
+
+    # Warm-up so one-time kernel selection and allocation are not timed (and the question set stays uncached)
+    answer(["Hello!"])
+    if device == "cuda":
+        torch.cuda.reset_peak_memory_stats()
+
+    latencies, ttfts, new_tokens, busy = [], [], 0, 0.0
+    batch_size = config["batch_size"]
+    # The first pass only fills the response cache; a second one is needed for it to serve any hits
+    passes = max(repeats, 2) if response_cache is not None else repeats
+    for _ in range(passes):
+        for i in range(0, len(questions), batch_size):
+            batch = questions[i:i + batch_size]
+            start = time.perf_counter()
+            first_token_time, tokens = answer(batch)
+            elapsed = time.perf_counter() - start
+            busy += elapsed
+            new_tokens += tokens
+            # Every question in a batch sees the batch's latency
+            latencies += [elapsed] * len(batch)
+            ttfts += [(first_token_time or start + elapsed) - start] * len(batch)
+
+    if response_cache is not None:
+        response_cache.close()
+        shutil.rmtree(cache_dir)
+
+    return {
+        **config,
+        "dtype": str(dtype).replace("torch.", ""),
+        "passes": passes,
+        "load_seconds": load_seconds,
+        "ttft_p50_ms": percentile(ttfts, 50) * 1000,
+        "latency_p50_ms": percentile(latencies, 50) * 1000,
+        "latency_p99_ms": percentile(latencies, 99) * 1000,
+        "tokens_per_s": new_tokens / busy if busy else 0.0,
+        "questions_per_s": len(latencies) / busy if busy else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_gpu_mb": torch.cuda.max_memory_allocated() / 2**20 if device == "cuda" else None,
+    }
+
+# --- SWEEP ---
+def expand_configs(args):
+    """All valid combinations of the requested configuration axes"""
+    weights = args.weights or (["peft", "merged"] if has_merged_model() else ["peft"])
+    axes = itertools.product(
+        [select_device(d) for d in args.devices], args.dtypes, weights,
+        args.prompt_cache, args.response_cache, args.speculative, args.batch_sizes,
+    )
+    configs = []
+    for device, dtype, weight, prompt_cache, response_cache, speculative, batch_size in axes:
+        # Speculative decoding is single-sequence
+        if speculative == "on" and batch_size > 1:
+            continue
+        configs.append({
+            "device": device, "dtype": dtype, "weights": weight,
+            "prompt_cache": prompt_cache == "on", "response_cache": response_cache == "on",
+            "speculative": speculative == "on", "batch_size": batch_size, "threads": args.threads,
+        })
+    return configs
+
+TABLE_COLUMNS = ["device", "dtype", "weights", "prompt_cache", "response_cache", "speculative", "batch_size",
+                 "load_seconds", "ttft_p50_ms", "latency_p50_ms", "latency_p99_ms", "tokens_per_s", "peak_rss_mb"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chat.py inference configurations")
+    parser.add_argument("--devices", type=csv_list(), default=["auto"], help="e.g. cpu,cuda")
+    parser.add_argument("--dtypes", type=csv_list(), default=["auto"], help=f"auto or any of {','.join(DTYPES)}")
+    parser.add_argument("--weights", type=csv_list(), default=None, help="peft,merged (default: all available)")
+    parser.add_argument("--prompt-cache", type=csv_list(), default=["on"], help="Preamble KV cache: on,off")
+    parser.add_argument("--response-cache", type=csv_list(), default=["off"], help="SQLite response cache: on,off")
+    parser.add_argument("--speculative", type=csv_list(), default=["off"], help="Prompt-lookup decoding: on,off")
+    parser.add_argument("--batch-sizes", type=csv_list(int), default=[1])
+    parser.add_argument("--questions", type=int, default=16, help="How many training questions to ask")
+    parser.add_argument("--repeats", type=int, default=1, help="Passes over the question set (at least 2 with the response cache on)")
+    parser.add_argument("--threads", type=int, default=None, help="CPU intra-op threads")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    questions = pick_questions(args.questions)
+
+    # Child process: measure a single configuration
+    if args.run_one:
+        result = run_config(json.loads(args.run_one), questions, args.repeats)
+        with open(args.result_file, "w") as f:
+            json.dump(result, f)
+        return
+
+    results = []
+    for config in expand_configs(args):
+        print(f"▶ {config}")
+        with tempfile.NamedTemporaryFile(suffix=".json") as result_file:
+            command = [sys.executable, __file__, "--run-one", json.dumps(config), "--result-file", result_file.name,
+                       "--questions", str(args.questions), "--repeats", str(args.repeats)]
+            if subprocess.run(command).returncode != 0:
+                print(f"❌ Configuration failed: {config}")
+                continue
+            with open(result_file.name) as f:
+                results.append(json.load(f))
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "cpu_count": os.cpu_count(),
+            "gpu": torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
+        },
+        "generation": generation_config,
+        "questions": questions,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print()
+    print_table(results, TABLE_COLUMNS)
+    print(f"\nSaved results to: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,85 +1,198 @@
+import argparse
+import copy
+import json
+import os
+import time
 import torch
-import re
-from transformers import AutoModelForCausalLM, AutoTokenizer, StoppingCriteria, StoppingCriteriaList
+from transformers import AutoModelForCausalLM, AutoTokenizer, DynamicCache, StoppingCriteria, StoppingCriteriaList
 from peft import PeftModel
+from hardware import DTYPES, configure_cpu_threads, select_device, select_dtype
+from profiling import ProfilerWindow, add_profile_arguments
+from qa_data import load_raw_data
+from response_cache import ResponseCache, make_key
+from speculative import AnswerIndex, speculative_generate
+from streaming import ArtifactFilter, ArtifactStop, TokenStreamer
 
 # --- CONFIGURATION ---
 base_model_name = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
 adapter_path = "Sidharth_AI_Model"
-
-print(f"Loading base model: {base_model_name}...")
-print("(This uses your RTX 3050 Ti VRAM)")
+merged_model_path = "Sidharth_AI_Model_merged"  # Written by export_merged.py
+merged_source_file = "source_adapter.json"  # Records which adapter a merged checkpoint was exported from
+response_cache_path = "response_cache.sqlite"
 
 # --- LOAD MODEL ---
-model = AutoModelForCausalLM.from_pretrained(
-    base_model_name,
-    load_in_4bit=True,
-    device_map="auto",
-    torch_dtype=torch.float16,
-)
+def adapter_mtime():
+    weights_file = os.path.join(adapter_path, "adapter_model.safetensors")
+    return os.path.getmtime(weights_file) if os.path.exists(weights_file) else None
+
+def merged_model_source():
+    """The adapter mtime recorded by export_merged.py, or None for a missing or unstamped export"""
+    source_file = os.path.join(merged_model_path, merged_source_file)
+    if not os.path.exists(os.path.join(merged_model_path, "model.safetensors")) or not os.path.exists(source_file):
+        return None
+    with open(source_file) as f:
+        return json.load(f).get("adapter_mtime")
+
+def has_merged_model():
+    """True when an exported checkpoint exists and was merged from the current adapter"""
+    source = merged_model_source()
+    return source is not None and source == adapter_mtime()
+
+def load_model(device, dtype, weights="auto"):
+    """Load the model for the given device.
+
+    weights="merged" loads the single safetensors checkpoint from export_merged.py
+    (memory-mapped, no LoRA matmuls per forward); weights="peft" loads the base
+    model and wraps it with the adapter; "auto" prefers the merged checkpoint
+    unless the adapter was retrained after it was exported.
+    """
+    if weights == "auto":
+        weights = "merged" if has_merged_model() else "peft"
+        if weights == "peft" and merged_model_source() is not None:
+            print(f"⚠️ {merged_model_path} is older than {adapter_path}; using the adapter (re-run export_merged.py)")
+    elif weights == "merged" and not has_merged_model():
+        print(f"❌ {merged_model_path} is missing or was not exported from the current {adapter_path}; "
+              f"re-run export_merged.py")
+        exit()
+    model_path = merged_model_path if weights == "merged" else base_model_name
 
-tokenizer = AutoTokenizer.from_pretrained(base_model_name)
+    print(f"Loading {'merged' if weights == 'merged' else 'base'} model: {model_path}...")
+    if device == "cuda":
+        print("(This uses your GPU VRAM, 4-bit quantized)")
+        model = AutoModelForCausalLM.from_pretrained(
+            model_path,
+            load_in_4bit=True,
+            device_map="auto",
+            torch_dtype=dtype,
+        )
+    else:
+        print(f"(Running on CPU in {dtype})")
+        model = AutoModelForCausalLM.from_pretrained(
+            model_path,
+            torch_dtype=dtype,
+            low_cpu_mem_usage=True,
+        )
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    # Batched generation needs the prompts right-aligned
+    tokenizer.padding_side = "left"
 
-# --- LOAD ADAPTER ---
-print(f"Loading your custom training from: {adapter_path}...")
-try:
-    model = PeftModel.from_pretrained(model, adapter_path)
+    # --- LOAD ADAPTER ---
+    if weights == "peft":
+        print(f"Loading your custom training from: {adapter_path}...")
+        try:
+            model = PeftModel.from_pretrained(model, adapter_path)
+        except Exception as e:
+            print(f"❌ Error loading adapter: {e}")
+            exit()
     print("✅ Success! Your custom Sidharth AI is loaded.")
-except Exception as e:
-    print(f"❌ Error loading adapter: {e}")
-    exit()
+
+    model.eval()
+    return model, tokenizer
 
 # --- CUSTOM STOPPING CRITERIA ---
+# Text that marks the end of an answer (the model was trained to emit "<|end▁of▁sentence|>")
+stop_strings = ["###", "</s>", "<|end"]
+
+def stop_token_sequences(tokenizer, strings):
+    """Every token sequence a stop string is likely to appear as mid-generation.
+
+    SentencePiece tokenizes "###" differently at the start of a text, after a
+    space and after a newline, so each context gets its own entry.
+    """
+    sequences = set()
+    for text in strings:
+        for context in ["", " ", "\n"]:
+            context_ids = tokenizer.encode(context, add_special_tokens=False) if context else []
+            ids = tokenizer.encode(context + text, add_special_tokens=False)
+            if ids[:len(context_ids)] == context_ids and len(ids) > len(context_ids):
+                sequences.add(tuple(ids[len(context_ids):]))
+    return sorted(sequences)
+
 class StopOnTokens(StoppingCriteria):
-    """Stop generation when specific tokens/patterns are detected"""
-    def __init__(self, tokenizer):
+    """Stop each row once it ends with EOS or any tokenization of a stop string.
+
+    All stop sequences are right-aligned in one padded tensor, so a step is a
+    single broadcast comparison over the batch with no host round-trip.
+    """
+    def __init__(self, tokenizer, strings=stop_strings):
         self.tokenizer = tokenizer
-        # Tokens that indicate end of response
-        self.stop_tokens = [
-            tokenizer.eos_token_id,
-            tokenizer.encode("###", add_special_tokens=False)[0] if len(tokenizer.encode("###", add_special_tokens=False)) > 0 else None,
-        ]
-        self.stop_tokens = [t for t in self.stop_tokens if t is not None]
-        
+        # Token sequences that indicate end of response
+        sequences = [(tokenizer.eos_token_id,), *stop_token_sequences(tokenizer, strings)]
+        width = max(len(sequence) for sequence in sequences)
+        self.stop_ids = torch.zeros(len(sequences), width, dtype=torch.long)
+        self.stop_mask = torch.zeros(len(sequences), width, dtype=torch.bool)
+        for row, sequence in enumerate(sequences):
+            self.stop_ids[row, width - len(sequence):] = torch.tensor(sequence)
+            self.stop_mask[row, width - len(sequence):] = True
+        self.finished = None
+
+    def reset(self):
+        """Forget per-row state before a new `generate` call"""
+        self.finished = None
+
     def __call__(self, input_ids, scores, **kwargs):
-        # Check if any of the last generated tokens are stop tokens
-        if len(input_ids[0]) > 0:
-            last_token = input_ids[0][-1].item()
-            if last_token in self.stop_tokens:
-                return True
-        return False
+        if self.stop_ids.device != input_ids.device:
+            self.stop_ids = self.stop_ids.to(input_ids.device)
+            self.stop_mask = self.stop_mask.to(input_ids.device)
+        if self.finished is None or self.finished.shape[0] != input_ids.shape[0]:
+            self.finished = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+        width = self.stop_ids.shape[1]
+        tail = input_ids[:, -width:]
+        if tail.shape[1] < width:
+            tail = torch.nn.functional.pad(tail, (width - tail.shape[1], 0), value=-1)
+
+        # [batch, sequences, width]: a sequence matches when every unmasked position agrees
+        matches = (tail[:, None, :] == self.stop_ids[None]) | ~self.stop_mask[None]
+        # Sticky per-row flags: rows keep their state after generate starts padding them
+        self.finished |= matches.all(dim=-1).any(dim=-1)
+        return self.finished.clone()
 
 def clean_response(text):
     """Clean up the model's response by removing training artifacts"""
-    # Remove common training artifacts
-    patterns_to_remove = [
-        r'<\|end[_\s]*of[_\s]*sentence\|>',  # End of sentence token
-        r'<\|end▁of▁sentence\|>',            # Unicode variant
-        r'</?\|end\s*of\s*query\|[>\]]?',    # End of query variants
-        r'</s>',                              # EOS token
-        r'<s>',                               # BOS token
-        r'###\s*(Instruction|Response|Input):.*',  # Training format markers
-        r'###.*$',                            # Any remaining ### markers
-        r'\[INST\].*?\[/INST\]',              # Instruction markers
-        r'Below is an instruction.*Response:',  # Alpaca prompt leakage
-        r'<\|.*?\|>',                         # Catch-all for any <|...|> tokens
-        r'</\|.*?\|[>\]]',                    # Catch-all for </|...|> variants
-    ]
-    
-    for pattern in patterns_to_remove:
-        text = re.sub(pattern, '', text, flags=re.IGNORECASE | re.DOTALL)
-    
-    # Remove multiple spaces and clean up
-    text = re.sub(r'\s+', ' ', text)
-    text = text.strip()
-    
-    # Take only the first complete response (stop at any new question marker)
-    if '\n\n' in text:
-        parts = text.split('\n\n')
-        # Keep only the first meaningful paragraph
-        text = parts[0].strip()
-    
-    return text
+    # Same rules as the streaming path, applied to the finished text in one pass
+    artifact_filter = ArtifactFilter()
+    return (artifact_filter.feed(text) + artifact_filter.flush()).strip()
+
+# --- PROMPT CACHE ---
+class PromptCache:
+    """KV cache for the constant prompt preamble, prefilled once and copied for each request"""
+    def __init__(self, model, tokenizer, prefix):
+        self.prefix_ids = tokenizer(prefix, return_tensors="pt")["input_ids"].to(model.device)
+        self.cache = DynamicCache()
+        with torch.no_grad():
+            model(input_ids=self.prefix_ids, past_key_values=self.cache, use_cache=True)
+
+    def get(self, input_ids):
+        """Return a private copy of the preamble cache, or None if `input_ids` don't start with the preamble"""
+        prefix_length = self.prefix_ids.shape[1]
+        # The question is tokenized together with the preamble, so check the boundary tokens really match
+        if (input_ids.shape[0] != 1
+                or input_ids.shape[1] <= prefix_length
+                or not torch.equal(input_ids[:, :prefix_length], self.prefix_ids)):
+            return None
+        # generate() appends to the cache in place
+        return copy.deepcopy(self.cache)
+
+# --- THROUGHPUT CHECK ---
+def measure_throughput(model, tokenizer, new_tokens=32):
+    """Time a short greedy generation and return decode tokens/s"""
+    inputs = tokenizer("Who is Sidharth E?", return_tensors="pt").to(model.device)
+    generation_kwargs = dict(
+        do_sample=False,
+        pad_token_id=tokenizer.pad_token_id,
+        eos_token_id=None,  # Always generate the full length
+    )
+    with torch.no_grad():
+        # Warm-up pass so one-time kernel selection / allocation is not timed
+        model.generate(**inputs, max_new_tokens=4, min_new_tokens=4, **generation_kwargs)
+        start = time.perf_counter()
+        model.generate(**inputs, max_new_tokens=new_tokens, min_new_tokens=new_tokens, **generation_kwargs)
+        elapsed = time.perf_counter() - start
+    return new_tokens / elapsed
 
 # --- CHAT SETUP ---
 alpaca_prompt = """Below is an instruction that describes a task. Write a response that appropriately completes the request.
@@ -90,46 +203,186 @@ alpaca_prompt = """Below is an instruction that describes a task. Write a respon
 ### Response:
 """
 
-model.eval()
-stop_criteria = StoppingCriteriaList([StopOnTokens(tokenizer)])
-
-print("\n" + "="*50)
-print("🤖 Sidharth AI Ready. Type 'exit' to quit.")
-print("="*50 + "\n")
+generation_config = dict(
+    max_new_tokens=150,           # Shorter for concise answers
+    temperature=0.3,              # Lower = more focused responses
+    do_sample=True,
+    top_p=0.9,
+    top_k=50,
+    repetition_penalty=1.3,       # Stronger repetition prevention
+    no_repeat_ngram_size=3,       # Prevent repeating 3-grams
+)
 
-while True:
-    question = input("\033[1;32mYou:\033[0m ")
-    if question.lower() in ["exit", "quit", "q"]:
-        break
+def reset_stop_criteria(stop_criteria):
+    for criterion in stop_criteria:
+        if isinstance(criterion, StopOnTokens):
+            criterion.reset()
 
-    # Format the input
-    input_text = alpaca_prompt.format(question)
-    inputs = tokenizer(input_text, return_tensors="pt").to("cuda")
-    input_length = inputs["input_ids"].shape[1]
+def generation_kwargs(tokenizer, stop_criteria, input_ids, prompt_cache=None):
+    """Full set of `generate` arguments for one request"""
+    reset_stop_criteria(stop_criteria)
+    return dict(
+        **generation_config,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+        stopping_criteria=stop_criteria,
+        use_cache=True,
+        # Only the question and "### Response:" suffix are prefilled
+        past_key_values=prompt_cache.get(input_ids) if prompt_cache is not None else None,
+    )
 
-    # Generate (non-streaming for cleaner output)
+def generate_answers(model, tokenizer, questions, stop_criteria, prompt_cache=None):
+    """Answer several questions with one left-padded `generate` call"""
+    inputs = tokenizer([alpaca_prompt.format(q) for q in questions], return_tensors="pt", padding=True).to(model.device)
     with torch.no_grad():
-        outputs = model.generate(
-            **inputs,
-            max_new_tokens=150,           # Shorter for concise answers
-            temperature=0.3,              # Lower = more focused responses
-            do_sample=True,
-            top_p=0.9,
-            top_k=50,
-            repetition_penalty=1.3,       # Stronger repetition prevention
-            no_repeat_ngram_size=3,       # Prevent repeating 3-grams
-            eos_token_id=tokenizer.eos_token_id,
-            pad_token_id=tokenizer.pad_token_id,
-            stopping_criteria=stop_criteria,
-            use_cache=True
-        )
-    
+        outputs = model.generate(**inputs, **generation_kwargs(tokenizer, stop_criteria, inputs["input_ids"], prompt_cache))
+
     # Decode only the new tokens (skip the prompt)
-    generated_tokens = outputs[0][input_length:]
-    raw_response = tokenizer.decode(generated_tokens, skip_special_tokens=True)
-    
-    # Clean up the response
-    clean_text = clean_response(raw_response)
-    
-    # Display the cleaned response
-    print(f"\033[1;36mAI:\033[0m {clean_text}\n")
\ No newline at end of file
+    generated_tokens = outputs[:, inputs["input_ids"].shape[1]:]
+    raw_responses = tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)
+
+    # Clean up the responses
+    return [clean_response(text) for text in raw_responses]
+
+# --- RESPONSE CACHE ---
+def cache_config():
+    """Everything besides the question that changes an answer; part of every cache key"""
+    # The adapter's mtime makes a retrain invalidate answers from the old weights
+    # (load_model never serves a merged checkpoint exported from an older adapter)
+    return {
+        "base_model": base_model_name,
+        "adapter": adapter_path,
+        "adapter_mtime": adapter_mtime(),
+        "prompt": alpaca_prompt,
+        "generation": generation_config,
+    }
+
+def add_cache_arguments(parser):
+    parser.add_argument("--cache", default=response_cache_path, help="SQLite file shared by all workers")
+    parser.add_argument("--no-cache", action="store_true", help="Always generate, never use the response cache")
+    parser.add_argument("--cache-size", type=int, default=1024, help="Most answers kept (least recently used go first)")
+    parser.add_argument("--cache-ttl", type=float, default=24 * 3600, help="Seconds before a cached answer expires")
+
+def open_response_cache(args):
+    if args.no_cache:
+        return None
+    return ResponseCache(args.cache, max_entries=args.cache_size, ttl=args.cache_ttl)
+
+# --- MODEL SETUP ---
+def add_model_arguments(parser):
+    parser.add_argument("--device", choices=["auto", "cuda", "cpu"], default="auto",
+                        help="Inference backend (auto picks CUDA when available)")
+    parser.add_argument("--dtype", choices=["auto", *DTYPES], default="auto",
+                        help="Weight dtype (auto: float16 on GPU, bfloat16/float32 on CPU)")
+    parser.add_argument("--weights", choices=["auto", "merged", "peft"], default="auto",
+                        help="merged: exported checkpoint from export_merged.py; peft: base + adapter (auto prefers merged)")
+    parser.add_argument("--threads", type=int, default=None, help="CPU intra-op threads (default: all usable cores)")
+    parser.add_argument("--interop-threads", type=int, default=None, help="CPU inter-op threads (default: 1)")
+
+def setup_model(args):
+    """Select the backend from parsed `add_model_arguments` flags and load the model"""
+    device = select_device(args.device)
+    dtype = select_dtype(device, args.dtype)
+    if device == "cpu":
+        intra_op, inter_op = configure_cpu_threads(args.threads, args.interop_threads)
+        print(f"CPU threads: {intra_op} intra-op, {inter_op} inter-op")
+
+    model, tokenizer = load_model(device, dtype, args.weights)
+    print(f"⚡ Throughput: {measure_throughput(model, tokenizer):.1f} tokens/s on {device} ({dtype})")
+    return model, tokenizer
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat with the fine-tuned Sidharth AI model")
+    parser.add_argument("--stream", action="store_true", help="Print tokens as they are generated")
+    parser.add_argument("--speculative", action="store_true",
+                        help="Draft tokens by n-gram lookup over the training answers and verify them in one pass")
+    add_model_arguments(parser)
+    add_cache_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    model, tokenizer = setup_model(args)
+    response_cache = open_response_cache(args)
+    response_cache_config = cache_config()
+    stop_criteria = StoppingCriteriaList([StopOnTokens(tokenizer)])
+    # Everything before the question is identical for every request
+    prompt_cache = PromptCache(model, tokenizer, alpaca_prompt.split("{}")[0])
+    answer_index = AnswerIndex(tokenizer, [item["output"] for item in load_raw_data()]) if args.speculative else None
+
+    # Profiles a window of generations (skipping the startup throughput probe)
+    profiler = ProfilerWindow.from_args(args, "chat")
+    if profiler is not None:
+        profiler.maybe_start()
+
+    print("\n" + "="*50)
+    print("🤖 Sidharth AI Ready. Type 'exit' to quit.")
+    print("="*50 + "\n")
+
+    try:
+        while True:
+            question = input("\033[1;32mYou:\033[0m ")
+            if question.lower() in ["exit", "quit", "q"]:
+                break
+
+            # Repeated questions are answered straight from the cache
+            cache_key = make_key(question, response_cache_config)
+            cached_text = response_cache.get(cache_key) if response_cache is not None else None
+            if cached_text is not None:
+                print(f"\033[1;36mAI:\033[0m {cached_text}\n")
+                continue
+
+            inputs = tokenizer(alpaca_prompt.format(question), return_tensors="pt").to(model.device)
+            streamer, criteria = None, stop_criteria
+
+            # Streaming: print each piece of text as soon as its tokens are decoded
+            if args.stream:
+                print("\033[1;36mAI:\033[0m ", end="", flush=True)
+                # Artifacts are stripped as text arrives; a terminal marker also ends generation
+                artifact_filter = ArtifactFilter()
+                pieces = []
+                def show(text):
+                    if text:
+                        pieces.append(text)
+                        print(text, end="", flush=True)
+                streamer = TokenStreamer(tokenizer, lambda text: show(artifact_filter.feed(text)))
+                criteria = StoppingCriteriaList([*stop_criteria, ArtifactStop(artifact_filter)])
+
+            if answer_index is not None:
+                reset_stop_criteria(criteria)
+                outputs = speculative_generate(model, inputs["input_ids"], answer_index, generation_config,
+                                               criteria, prompt_cache, streamer)
+            else:
+                with torch.no_grad():
+                    outputs = model.generate(**inputs, streamer=streamer,
+                                             **generation_kwargs(tokenizer, criteria, inputs["input_ids"], prompt_cache))
+            if profiler is not None:
+                profiler.step()
+
+            if args.stream:
+                show(artifact_filter.flush())
+                print("\n")
+                clean_text = "".join(pieces).strip()
+            else:
+                # Decode only the new tokens (skip the prompt) and clean up the response
+                raw_response = tokenizer.decode(outputs[0][inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+                clean_text = clean_response(raw_response)
+
+                # Display the cleaned response
+                print(f"\033[1;36mAI:\033[0m {clean_text}\n")
+
+            if response_cache is not None:
+                response_cache.put(cache_key, clean_text)
+    except (EOFError, KeyboardInterrupt):
+        # Ctrl-D / Ctrl-C end the session like "exit"
+        print()
+    finally:
+        # Export whatever the window recorded, however the session ends
+        if profiler is not None:
+            profiler.finish()
+
+    if response_cache is not None:
+        stats = response_cache.stats()
+        print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import dataclasses
+import json
+import os
+import random
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import torch
+from peft import get_peft_model_state_dict, set_peft_model_state_dict
+from safetensors.torch import load_file, save_file
+from transformers import TrainerCallback
+
+# File names the Trainer looks for in `resume_from_checkpoint`
+ADAPTER_WEIGHTS = "adapter_model.safetensors"
+OPTIMIZER = "optimizer.pt"
+SCHEDULER = "scheduler.pt"
+TRAINER_STATE = "trainer_state.json"
+# Early-stopping state, so a resumed run keeps its best adapter and patience count
+BEST_ADAPTER_WEIGHTS = "best_adapter.safetensors"
+BEST_ADAPTER_STATE = "best_adapter.json"
+CHECKPOINT_PATTERN = re.compile(r"^checkpoint-(\d+)$")
+
+def _to_cpu(value):
+    """Copy every tensor in a (nested) state dict to CPU, so the live training state can keep changing"""
+    if isinstance(value, torch.Tensor):
+        return value.detach().to("cpu", copy=True)
+    if isinstance(value, dict):
+        return {key: _to_cpu(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_to_cpu(item) for item in value)
+    return value
+
+def _rng_state(distributed):
+    state = {"python": random.getstate(), "numpy": np.random.get_state(), "cpu": torch.random.get_rng_state()}
+    if torch.cuda.is_available():
+        # Same layout as Trainer._save_rng_state, so Trainer._load_rng_state can restore it
+        state["cuda"] = torch.cuda.random.get_rng_state_all() if distributed else torch.cuda.random.get_rng_state()
+    return state
+
+def _atomic_save(save, path):
+    """Write through a temporary name so a crash mid-write never leaves a truncated file at `path`"""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    save(tmp_path)
+    os.replace(tmp_path, path)
+
+def _text_writer(text):
+    def save(path):
+        with open(path, "w") as f:
+            f.write(text)
+    return save
+
+def save_adapter(model, adapter_name, path):
+    """Save one adapter of a multi-adapter PeftModel as a standalone adapter directory (it loads as "default")"""
+    os.makedirs(path, exist_ok=True)
+    weights = _to_cpu(get_peft_model_state_dict(model, adapter_name=adapter_name))
+    save_file(weights, os.path.join(path, ADAPTER_WEIGHTS), metadata={"format": "pt"})
+    model.peft_config[adapter_name].save_pretrained(path)
+
+def completed_checkpoints(output_dir):
+    """checkpoint-N directories whose trainer state (written last) exists, oldest first"""
+    if not os.path.isdir(output_dir):
+        return []
+    found = []
+    for name in os.listdir(output_dir):
+        match = CHECKPOINT_PATTERN.match(name)
+        path = os.path.join(output_dir, name)
+        if match and os.path.isfile(os.path.join(path, TRAINER_STATE)):
+            found.append((int(match.group(1)), path))
+    return [path for _, path in sorted(found)]
+
+def latest_checkpoint(output_dir):
+    checkpoints = completed_checkpoints(output_dir)
+    return checkpoints[-1] if checkpoints else None
+
+class AsyncCheckpointCallback(TrainerCallback):
+    """Every `save_steps` steps, save a resumable checkpoint holding only the LoRA weights, optimizer,
+    scheduler and RNG state, keeping the newest `save_total_limit` (0: all).
+
+    The state is copied to CPU on the training thread (a few MB for LoRA) and
+    serialized on a background thread, so the loop never waits on disk. Files
+    use the names `Trainer.train(resume_from_checkpoint=...)` expects, and
+    trainer_state.json is written last to mark the checkpoint complete. With a
+    `best_adapter` callback, its early-stopping state is saved alongside.
+    """
+    def __init__(self, save_steps, save_total_limit=2, best_adapter=None):
+        self.save_steps = save_steps
+        self.save_total_limit = save_total_limit
+        self.best_adapter = best_adapter
+        self.save_after_evaluate = False
+        # One writer keeps checkpoints in order; a slow disk queues snapshots instead of blocking training
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = []
+
+    def on_step_end(self, args, state, control, model=None, optimizer=None, lr_scheduler=None, **kwargs):
+        if self.save_steps <= 0 or state.global_step % self.save_steps != 0:
+            return
+        if control.should_evaluate:
+            # Like the Trainer's own saves, include this step's evaluation (and the early-stopping state it updates)
+            self.save_after_evaluate = True
+            return
+        self._snapshot(args, state, model, optimizer, lr_scheduler)
+
+    def on_evaluate(self, args, state, control, model=None, optimizer=None, lr_scheduler=None, **kwargs):
+        if self.save_after_evaluate:
+            self.save_after_evaluate = False
+            self._snapshot(args, state, model, optimizer, lr_scheduler)
+
+    def _snapshot(self, args, state, model, optimizer, lr_scheduler):
+        path = os.path.join(args.output_dir, f"checkpoint-{state.global_step}")
+        rng_state = _rng_state(args.world_size > 1)
+        if args.world_size > 1:
+            # Rank 0 writes every process's RNG state, so they all exist once the checkpoint is marked complete
+            gathered = [None] * args.world_size if state.is_world_process_zero else None
+            torch.distributed.gather_object(rng_state, gathered, dst=0)
+            rng_files = {f"rng_state_{rank}.pth": rank_state for rank, rank_state in enumerate(gathered or [])}
+        else:
+            rng_files = {"rng_state.pth": rng_state}
+        # Replicas hold identical weights and optimizer state; only the first process writes anything
+        if not state.is_world_process_zero:
+            return
+        snapshot = dict(
+            rng=rng_files,
+            adapter=_to_cpu(get_peft_model_state_dict(model)),
+            adapter_config=model.peft_config[model.active_adapter],
+            optimizer=_to_cpu(optimizer.state_dict()),
+            scheduler=lr_scheduler.state_dict(),
+            trainer_state=json.dumps(dataclasses.asdict(state), indent=2, sort_keys=True) + "\n",
+        )
+        if self.best_adapter is not None:
+            snapshot["best"] = self.best_adapter.snapshot()
+        self.pending = [future for future in self.pending if not future.done()]
+        self.pending.append(self.executor.submit(self._write, path, snapshot, args.output_dir))
+
+    def _write(self, path, snapshot, output_dir):
+        os.makedirs(path, exist_ok=True)
+        for name, rng_state in snapshot["rng"].items():
+            _atomic_save(lambda p: torch.save(rng_state, p), os.path.join(path, name))
+        _atomic_save(lambda p: save_file(snapshot["adapter"], p, metadata={"format": "pt"}),
+                     os.path.join(path, ADAPTER_WEIGHTS))
+        snapshot["adapter_config"].save_pretrained(path)
+        _atomic_save(lambda p: torch.save(snapshot["optimizer"], p), os.path.join(path, OPTIMIZER))
+        _atomic_save(lambda p: torch.save(snapshot["scheduler"], p), os.path.join(path, SCHEDULER))
+        if "best" in snapshot:
+            best_state, best_weights = snapshot["best"]
+            if best_weights is not None:
+                _atomic_save(lambda p: save_file(best_weights, p, metadata={"format": "pt"}),
+                             os.path.join(path, BEST_ADAPTER_WEIGHTS))
+            _atomic_save(_text_writer(json.dumps(best_state) + "\n"), os.path.join(path, BEST_ADAPTER_STATE))
+        _atomic_save(_text_writer(snapshot["trainer_state"]), os.path.join(path, TRAINER_STATE))
+
+        # A limit of 0 keeps every checkpoint
+        if self.save_total_limit > 0:
+            for old in completed_checkpoints(output_dir)[:-self.save_total_limit]:
+                shutil.rmtree(old, ignore_errors=True)
+        print(f"Saved checkpoint: {path}")
+
+    def on_train_end(self, args, state, control, **kwargs):
+        # Let queued checkpoints finish and surface any write error
+        for future in self.pending:
+            future.result()
+        self.pending = []
+
+class BestAdapterCallback(TrainerCallback):
+    """Early stopping on the validation loss, keeping the best LoRA weights in memory.
+
+    Training stops after `patience` evaluations without an improvement of more
+    than `min_delta`, and the best adapter is loaded back into the model when
+    training ends. Only the adapter is snapshotted, so no checkpoint on disk is
+    needed (unlike `load_best_model_at_end`).
+    """
+    def __init__(self, patience=3, min_delta=0.0, metric="eval_loss"):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.metric = metric
+        self.best = None
+        self.best_step = None
+        self.best_adapter = None
+        self.bad_evaluations = 0
+
+    def snapshot(self):
+        """(counters, best adapter weights) for `AsyncCheckpointCallback`; the weights are never modified in place"""
+        return {"best": self.best, "best_step": self.best_step, "bad_evaluations": self.bad_evaluations}, self.best_adapter
+
+    def load_checkpoint(self, path):
+        """Continue from the early-stopping state saved in checkpoint `path`"""
+        state_path = os.path.join(path, BEST_ADAPTER_STATE)
+        if not os.path.isfile(state_path):
+            return
+        with open(state_path) as f:
+            saved = json.load(f)
+        self.best, self.best_step, self.bad_evaluations = saved["best"], saved["best_step"], saved["bad_evaluations"]
+        weights_path = os.path.join(path, BEST_ADAPTER_WEIGHTS)
+        self.best_adapter = load_file(weights_path) if os.path.isfile(weights_path) else None
+
+    def on_evaluate(self, args, state, control, metrics=None, model=None, **kwargs):
+        value = (metrics or {}).get(self.metric)
+        if value is None:
+            return
+        if self.best is None or value < self.best - self.min_delta:
+            self.best, self.best_step = value, state.global_step
+            self.best_adapter = _to_cpu(get_peft_model_state_dict(model))
+            self.bad_evaluations = 0
+        else:
+            self.bad_evaluations += 1
+            if self.bad_evaluations >= self.patience:
+                control.should_training_stop = True
+                if state.is_world_process_zero:
+                    print(f"Early stopping at step {state.global_step}: {self.metric} has not improved "
+                          f"for {self.patience} evaluations")
+
+    def on_train_end(self, args, state, control, model=None, **kwargs):
+        if self.best_adapter is None:
+            return
+        set_peft_model_state_dict(model, self.best_adapter)
+        if state.is_world_process_zero:
+            print(f"Restored the best adapter from step {self.best_step} ({self.metric} {self.best:.4f})")
@@ -0,0 +1,90 @@
+from contextlib import contextmanager
+import torch
+import torch.nn.functional as F
+from torch import nn
+from torch.utils.checkpoint import checkpoint
+
+# --- CHUNKED LM HEAD + CROSS-ENTROPY ---
+class HiddenStatesHead(nn.Module):
+    """Drop-in for a causal LM's lm_head that can hand back the final hidden states instead of logits.
+
+    Inside `bypass()` the model's "logits" output is the [batch, seq, hidden]
+    tensor, so the full-vocabulary logits are never built by the forward pass;
+    `chunked_causal_lm_loss` projects them chunk by chunk instead. Outside it
+    the wrapped head runs as usual (evaluation code, generation).
+    """
+    def __init__(self, head):
+        super().__init__()
+        self.head = head
+        self.passthrough = False
+
+    @property
+    def weight(self):
+        return self.head.weight
+
+    @property
+    def bias(self):
+        return self.head.bias
+
+    def forward(self, hidden_states):
+        return hidden_states if self.passthrough else self.head(hidden_states)
+
+    @contextmanager
+    def bypass(self):
+        self.passthrough = True
+        try:
+            yield
+        finally:
+            self.passthrough = False
+
+def install_hidden_states_head(model):
+    """Wrap the lm_head of `model` (a PeftModel or plain causal LM) and return the wrapper"""
+    base = model.get_base_model() if hasattr(model, "get_base_model") else model
+    head = base.get_output_embeddings()
+    if not isinstance(head, HiddenStatesHead):
+        head = HiddenStatesHead(head)
+        base.set_output_embeddings(head)
+    return head
+
+def chunk_tokens_for_budget(vocab_size, budget_mb):
+    """Tokens per chunk so one chunk's fp32 logits take about `budget_mb`"""
+    return max(1, budget_mb * 2**20 // (vocab_size * 4))
+
+def _chunk_loss(hidden_states, weight, bias, targets):
+    logits = F.linear(hidden_states, weight, bias).float()
+    return F.cross_entropy(logits, targets, reduction="sum")
+
+def chunked_causal_lm_loss(hidden_states, weight, labels, chunk_tokens, bias=None, num_items_in_batch=None,
+                           ignore_index=-100):
+    """Next-token cross-entropy computed `chunk_tokens` positions at a time.
+
+    Matches the usual causal-LM loss (shift by one, ignore `ignore_index`, mean
+    over targets or sum / `num_items_in_batch`). Only positions with a target
+    are projected, and each chunk's logits are recomputed in backward instead
+    of being kept, so peak memory is one chunk of logits whatever the vocabulary
+    or sequence length.
+    """
+    hidden_states = hidden_states[:, :-1].reshape(-1, hidden_states.shape[-1])
+    targets = labels[:, 1:].reshape(-1).to(hidden_states.device)
+    keep = targets != ignore_index
+    hidden_states, targets = hidden_states[keep], targets[keep]
+
+    if not targets.shape[0]:
+        # Nothing to predict, but the loss must stay in the graph: backward() needs a grad_fn, and DDP expects a
+        # (zero) gradient for every trainable parameter
+        total = (hidden_states.sum() + weight.sum()).float() * 0.0
+    else:
+        total = hidden_states.new_zeros((), dtype=torch.float32)
+    for start in range(0, targets.shape[0], chunk_tokens):
+        end = start + chunk_tokens
+        total = total + checkpoint(_chunk_loss, hidden_states[start:end], weight, bias, targets[start:end],
+                                   use_reentrant=False)
+
+    if num_items_in_batch is not None:
+        # A fully masked accumulation window counts zero items; keep its loss 0 rather than 0 / 0
+        if torch.is_tensor(num_items_in_batch):
+            num_items_in_batch = num_items_in_batch.to(total.device).clamp(min=1)
+        else:
+            num_items_in_batch = max(num_items_in_batch, 1)
+        return total / num_items_in_batch
+    return total / max(targets.shape[0], 1)
@@ -0,0 +1,40 @@
+import argparse
+import json
+import os
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+from peft import PeftModel
+from chat import adapter_mtime, adapter_path, base_model_name, merged_model_path, merged_source_file
+from hardware import DTYPES
+
+def export_merged(output_dir, dtype):
+    """Fold the LoRA adapter into the base weights and save a single safetensors checkpoint"""
+    # Merge in fp32 so the low-rank update is added without rounding, then cast once
+    print(f"Loading base model: {base_model_name}...")
+    model = AutoModelForCausalLM.from_pretrained(base_model_name, torch_dtype=torch.float32, low_cpu_mem_usage=True)
+
+    print(f"Loading adapter: {adapter_path}...")
+    # Read before loading, so a retrain during the export leaves the result marked stale
+    source_mtime = adapter_mtime()
+    model = PeftModel.from_pretrained(model, adapter_path)
+
+    print("Merging LoRA weights into the base model...")
+    model = model.merge_and_unload()
+    model = model.to(dtype)
+
+    print(f"Saving merged model to: {output_dir}...")
+    # One shard, so chat.py memory-maps a single model.safetensors at load
+    model.save_pretrained(output_dir, safe_serialization=True, max_shard_size="100GB")
+    AutoTokenizer.from_pretrained(base_model_name).save_pretrained(output_dir)
+    # Written last: chat.py only serves a checkpoint stamped with the current adapter's mtime
+    with open(os.path.join(output_dir, merged_source_file), "w") as f:
+        json.dump({"adapter": adapter_path, "adapter_mtime": source_mtime}, f)
+    print("Done!")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge the Sidharth_AI_Model adapter into TinyLlama for fast loading")
+    parser.add_argument("--output-dir", default=merged_model_path)
+    parser.add_argument("--dtype", choices=list(DTYPES), default="bfloat16",
+                        help="Stored weight dtype (bfloat16 suits CPU serving; chat.py converts if needed)")
+    args = parser.parse_args()
+    export_merged(args.output_dir, DTYPES[args.dtype])
@@ -0,0 +1,84 @@
+import os
+import resource
+import sys
+import torch
+
+DTYPES = {
+    "float16": torch.float16,
+    "bfloat16": torch.bfloat16,
+    "float32": torch.float32,
+}
+
+
+def select_device(requested="auto"):
+    """Pick the compute device: CUDA when a GPU is visible, otherwise CPU"""
+    if requested != "auto":
+        return requested
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def cpu_supports_bf16():
+    """Check /proc/cpuinfo for native bf16 instructions (AVX512-BF16 / AMX on x86, BF16 on Arm)"""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = set(f.read().split())
+    except OSError:
+        return False
+    return bool(flags & {"avx512_bf16", "amx_bf16", "bf16"})
+
+
+def select_dtype(device, requested="auto"):
+    """fp16 on GPU; bf16 on CPUs that support it natively, fp32 otherwise"""
+    if requested != "auto":
+        return DTYPES[requested]
+    if device == "cuda":
+        return torch.float16
+    return torch.bfloat16 if cpu_supports_bf16() else torch.float32
+
+
+def usable_cores():
+    """Number of cores this process is allowed to run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def configure_cpu_threads(intra_op=None, inter_op=None):
+    """Size torch's intra-op / inter-op thread pools and return the values in effect"""
+    torch.set_num_threads(intra_op or usable_cores())
+    try:
+        # Decoding is a chain of dependent ops, so one inter-op thread avoids oversubscription
+        torch.set_num_interop_threads(inter_op or 1)
+    except RuntimeError:
+        # Can only be set once, before any inter-op parallel work has started
+        pass
+    return torch.get_num_threads(), torch.get_num_interop_threads()
+
+
+def pin_cpu_cores(count, offset=0):
+    """Restrict this process (and the threads it starts later) to `count` of its allowed cores, from `offset`"""
+    if not hasattr(os, "sched_setaffinity"):
+        return None
+    allowed = sorted(os.sched_getaffinity(0))
+    if count < 1 or offset < 0 or offset + count > len(allowed):
+        raise ValueError(f"Cannot pin to cores {offset}..{offset + count - 1}: only {len(allowed)} are available")
+    cores = allowed[offset:offset + count]
+    os.sched_setaffinity(0, cores)
+    return cores
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far"""
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def rss_mb():
+    """Current resident memory of this process (the peak so far where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except OSError:
+        return peak_rss_mb()
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / 2**20
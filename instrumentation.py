@@ -0,0 +1,168 @@
+import json
+import os
+import time
+from collections import deque
+import torch
+from transformers import TrainerCallback
+from hardware import rss_mb
+
+PHASES = ["data", "forward", "backward", "optimizer"]
+
+class StepMetricsCallback(TrainerCallback):
+    """Per-step throughput and memory, written as JSONL to `<output_dir>/step_metrics.jsonl`.
+
+    Memory is the step's GPU allocator peak (`peak_memory_mb`) on CUDA, and the
+    process RSS at the end of the step (`rss_mb`) on CPU.
+
+    Token counts come from the `PaddingTracker` wrapping the collator. The
+    dataloader collates a batch ahead of the one being trained on, so counts
+    are queued per batch and consumed one per micro-batch. Evaluation between
+    steps is excluded.
+
+    With `phases`, each optimizer step is also split into phases from the
+    Trainer's callback events plus forward hooks on the model:
+
+    - data: previous step end -> step begin (fetching and collating the batch)
+    - forward: inside the model's forward calls
+    - backward: the rest of the forward/backward pass, including gradient clipping.
+      With the chunked loss this includes the lm_head projection and cross-entropy,
+      which run after the model's forward
+    - optimizer: optimizer.step(), the scheduler and zeroing gradients
+
+    On CUDA every phase boundary then synchronizes, so the phases reflect kernel
+    time rather than launch time, at the cost of stalling the GPU queue several
+    times a step. Without `phases` nothing synchronizes.
+    """
+    def __init__(self, tracker, filename="step_metrics.jsonl", phases=False):
+        self.tracker = tracker
+        self.filename = filename
+        self.phases = phases
+        self.records = []
+        self.file = None
+        self.hooks = []
+        self.cuda = False
+
+    def _now(self):
+        if self.cuda and self.phases:
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def _forward_start(self, module, inputs):
+        if module.training:
+            self.forward_start = self._now()
+
+    def _forward_end(self, module, inputs, outputs):
+        if module.training and self.forward_start is not None:
+            self.forward_seconds += self._now() - self.forward_start
+            self.forward_start = None
+
+    def on_train_begin(self, args, state, control, model=None, **kwargs):
+        self.cuda = next(model.parameters()).is_cuda
+        if self.phases:
+            self.hooks = [model.register_forward_pre_hook(self._forward_start),
+                          model.register_forward_hook(self._forward_end)]
+        self.forward_start = None
+        self.step_start = None
+        self.micro_batches = 0
+        self.tracker.batches = deque()
+        self.queued = 0
+        if state.is_world_process_zero:
+            os.makedirs(args.output_dir, exist_ok=True)
+            path = os.path.join(args.output_dir, self.filename)
+            # A resumed run continues the existing file, minus the steps after the checkpoint that are about to rerun
+            kept = []
+            if state.global_step and os.path.exists(path):
+                with open(path) as f:
+                    kept = [line for line in f if line.strip() and json.loads(line)["step"] <= state.global_step]
+            self.file = open(path, "w")
+            self.file.writelines(kept)
+            self.file.flush()
+        self.last_end = self._now()
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        # With gradient accumulation this fires once per micro-batch; keep the first
+        if self.step_start is not None:
+            return
+        self.step_start = self._now()
+        self.forward_seconds = 0.0
+        self.micro_batches = 1
+        if self.cuda:
+            torch.cuda.reset_peak_memory_stats()
+
+    def on_substep_end(self, args, state, control, **kwargs):
+        self.micro_batches += 1
+
+    def on_pre_optimizer_step(self, args, state, control, **kwargs):
+        if self.phases:
+            self.optimizer_start = self._now()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        end = self._now()
+        batches = self.tracker.batches
+        consumed = [batches.popleft() for _ in range(min(self.micro_batches, len(batches)))]
+        examples, real, total = (sum(column) for column in zip((0, 0, 0), *consumed))
+        self.queued = len(batches)
+        step_seconds = end - self.last_end
+        record = {"step": state.global_step, "epoch": round(state.epoch, 4)}
+        if self.phases:
+            record.update({
+                "data_s": self.step_start - self.last_end,
+                "forward_s": self.forward_seconds,
+                "backward_s": self.optimizer_start - self.step_start - self.forward_seconds,
+                "optimizer_s": end - self.optimizer_start,
+            })
+        record.update({
+            "step_s": step_seconds,
+            "examples": examples,
+            "tokens": real,
+            "padded_tokens": total,
+            "padding_fraction": 1 - real / total if total else 0.0,
+            "tokens_per_s": real / step_seconds,
+            "examples_per_s": examples / step_seconds,
+        })
+        if self.cuda:
+            record["peak_memory_mb"] = torch.cuda.max_memory_allocated() / 2**20
+        else:
+            record["rss_mb"] = rss_mb()
+        self.records.append(record)
+        if self.file is not None:
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+        self.step_start = None
+        self.last_end = end
+
+    def on_evaluate(self, args, state, control, **kwargs):
+        # Evaluation batches go through the same collator after the prefetched training batch; drop them
+        while len(self.tracker.batches) > self.queued:
+            self.tracker.batches.pop()
+        self.last_end = self._now()
+
+    def on_train_end(self, args, state, control, **kwargs):
+        for hook in self.hooks:
+            hook.remove()
+        self.hooks = []
+        self.tracker.batches = None
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        if state.is_world_process_zero and self.records:
+            print_summary(self.records, args.world_size, os.path.join(args.output_dir, self.filename))
+
+def print_summary(records, processes=1, path=None):
+    # The first step pays for warm-up (allocations, kernel selection); leave it out when there are others
+    steady = records[1:] if len(records) > 1 else records
+    seconds = sum(r["step_s"] for r in steady)
+    tokens = sum(r["tokens"] for r in steady)
+    padded = sum(r["padded_tokens"] for r in steady)
+    examples = sum(r["examples"] for r in steady)
+    print(f"📊 {len(records)} steps, {seconds / len(steady) * 1000:.0f} ms/step"
+          + (f" ({processes} processes, per-process figures)" if processes > 1 else ""))
+    if "forward_s" in steady[0]:
+        print("   " + ", ".join(f"{phase} {sum(r[f'{phase}_s'] for r in steady) / seconds:.0%}" for phase in PHASES))
+    print(f"   {tokens / seconds:.0f} tokens/s ({padded / seconds:.0f} incl. padding), "
+          f"{examples / seconds:.2f} examples/s, padding {1 - tokens / padded if padded else 0:.1%}")
+    memory = (f"peak memory (GPU) {max(r['peak_memory_mb'] for r in records):.0f} MB" if "peak_memory_mb" in records[0]
+              else f"RSS (max at step end) {max(r['rss_mb'] for r in records):.0f} MB")
+    print(f"   {memory}"
+          + (f"; per-step metrics in {path}" if path else ""))
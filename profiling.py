@@ -0,0 +1,103 @@
+import argparse
+import os
+import torch
+from torch.profiler import ProfilerActivity, profile
+from transformers import TrainerCallback
+
+# --- PROFILING WINDOW ---
+def parse_window(spec):
+    """"SKIP:COUNT" (or just "COUNT", skipping nothing) -> (skip, count); None/"" -> None (profiling off)"""
+    if not spec:
+        return None
+    skip, _, count = spec.rpartition(":")
+    skip, count = int(skip or 0), int(count)
+    if skip < 0 or count < 1:
+        raise ValueError(f"Invalid profiling window {spec!r}: expected SKIP:COUNT with COUNT >= 1")
+    return skip, count
+
+def _window_argument(spec):
+    try:
+        return parse_window(spec)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid profiling window {spec!r}: expected SKIP:COUNT or COUNT, "
+                                         "with SKIP >= 0 and COUNT >= 1")
+
+def add_profile_arguments(parser):
+    # The $PROFILE default goes through the same parsing, so a bad value is a usage error too
+    parser.add_argument("--profile", metavar="SKIP:COUNT", type=_window_argument, default=os.environ.get("PROFILE"),
+                        help="Profile COUNT steps/generations after skipping SKIP (default: $PROFILE, off when unset)")
+    parser.add_argument("--profile-dir", default=os.environ.get("PROFILE_DIR", "profiles"),
+                        help="Where to write the Chrome trace and the top-operators table")
+
+class ProfilerWindow:
+    """Run torch.profiler over `count` units of work (training steps, generations) after `skip` of them.
+
+    Call `maybe_start()` before the first unit and `step()` after each one. When
+    the window closes it writes `<name>.trace.json` (open in chrome://tracing
+    or Perfetto) and `<name>.top_ops.txt` to `output_dir`.
+    """
+    def __init__(self, skip, count, output_dir="profiles", name="profile", row_limit=30):
+        self.skip = skip
+        self.count = count
+        self.output_dir = output_dir
+        self.name = name
+        self.row_limit = row_limit
+        self.completed = 0
+        self.profiler = None
+        self.finished = False
+
+    @classmethod
+    def from_args(cls, args, name):
+        """A window for parsed `add_profile_arguments` flags ((skip, count) or None), or None when profiling is off"""
+        window = args.profile
+        return cls(*window, output_dir=args.profile_dir, name=name) if window else None
+
+    def maybe_start(self):
+        if self.profiler is not None or self.finished or self.completed != self.skip:
+            return
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        self.profiler = profile(activities=activities, record_shapes=True, profile_memory=True)
+        self.profiler.start()
+        print(f"🔬 Profiling {self.count} step(s) into {self.output_dir}/")
+
+    def step(self):
+        self.completed += 1
+        if self.profiler is not None:
+            self.profiler.step()
+            if self.completed >= self.skip + self.count:
+                self.finish()
+        self.maybe_start()
+
+    def finish(self):
+        """Stop and export; a window cut short (e.g. training ended early) still exports what it recorded"""
+        if self.profiler is None:
+            return
+        self.profiler.stop()
+        self.finished = True
+        os.makedirs(self.output_dir, exist_ok=True)
+        trace_path = os.path.join(self.output_dir, f"{self.name}.trace.json")
+        table_path = os.path.join(self.output_dir, f"{self.name}.top_ops.txt")
+        self.profiler.export_chrome_trace(trace_path)
+        # The device-generic key; torch has deprecated the CUDA-specific "self_cuda_time_total"
+        sort_by = "self_device_time_total" if torch.cuda.is_available() else "self_cpu_time_total"
+        table = self.profiler.key_averages().table(sort_by=sort_by, row_limit=self.row_limit)
+        with open(table_path, "w") as f:
+            f.write(table + "\n")
+        self.profiler = None
+        print(f"🔬 Profile written: {trace_path}, {table_path}")
+
+class ProfilerCallback(TrainerCallback):
+    """Drive a `ProfilerWindow` from the Trainer's optimizer steps"""
+    def __init__(self, window):
+        self.window = window
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.window.maybe_start()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        self.window.step()
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self.window.finish()
@@ -0,0 +1,38 @@
+import hashlib
+import json
+
+# --- TRAINING Q&A DATA ---
+# One {"text": question, "output": answer} record per line (JSONL) or per row (Parquet)
+dataset_path = "data/sidharth_qa.jsonl"
+
+def iter_qa_pairs(path=dataset_path, batch_size=1024):
+    """Yield Q&A records one at a time, so memory stays flat however large the file is"""
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet datasets requires pyarrow: pip install pyarrow") from None
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=["text", "output"]):
+            yield from batch.to_pylist()
+        return
+
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "text" not in item or "output" not in item:
+                raise ValueError(f"{path}:{line_number}: expected \"text\" and \"output\" fields")
+            yield item
+
+def load_raw_data(path=dataset_path):
+    """All Q&A records as a list (for the small consumers: speculative drafts, benchmark questions)"""
+    return list(iter_qa_pairs(path))
+
+def file_digest(path, chunk_size=1 << 20):
+    """sha256 of a file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
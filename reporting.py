@@ -0,0 +1,14 @@
+# --- COMMAND-LINE REPORTING ---
+def csv_list(cast=str):
+    """argparse type for comma-separated values, e.g. `--r 8,16` -> [8, 16]"""
+    return lambda value: [cast(v) for v in value.split(",")]
+
+def print_table(results, columns, decimals=None):
+    """Print `columns` of each result dict as aligned text; floats get one decimal unless `decimals` names the column"""
+    decimals = decimals or {}
+    rows = [[f"{r[c]:.{decimals.get(c, 1)}f}" if isinstance(r[c], float) else str(r[c]) for c in columns]
+            for r in results]
+    widths = [max([len(c)] + [len(row[i]) for row in rows]) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(v.ljust(w) for v, w in zip(row, widths)))
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+def normalize_question(question):
+    """Casefold, collapse whitespace and drop trailing punctuation so trivial variants share an entry"""
+    question = re.sub(r"\s+", " ", question.casefold()).strip()
+    return question.rstrip(" ?!.")
+
+def make_key(question, config):
+    """Cache key over the normalized question plus everything that changes the answer"""
+    payload = json.dumps({"question": normalize_question(question), "config": config}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+# --- RESPONSE CACHE ---
+class ResponseCache:
+    """SQLite-backed answer cache with LRU + TTL eviction, shared by every process that opens the same file.
+
+    Lookups are plain reads: hit/miss counters are kept in memory and flushed to
+    the shared stats table every `flush_interval` seconds (and on `put`, `stats`
+    and `close`), and a hit refreshes its LRU timestamp only when it is older
+    than `touch_interval` seconds. The connection may be used from any thread,
+    one call at a time.
+    """
+    def __init__(self, path, max_entries=1024, ttl=24 * 3600, touch_interval=60, flush_interval=10):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.touch_interval = touch_interval
+        self.flush_interval = flush_interval
+        self.pending = {"hits": 0, "misses": 0, "evictions": 0}
+        self.last_flush = time.time()
+        self.lock = threading.Lock()
+        # WAL lets concurrent readers proceed while another worker writes
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    answer TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    last_access REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+                CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+                INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0), ('evictions', 0);
+            """)
+
+    def _flush(self, now):
+        """Add the in-memory counters to the shared stats table; call inside a transaction"""
+        for name, amount in self.pending.items():
+            if amount:
+                self.conn.execute("UPDATE stats SET value = value + ? WHERE name = ?", (amount, name))
+        self.pending = dict.fromkeys(self.pending, 0)
+        self.last_flush = now
+
+    def _maybe_flush(self, now):
+        if now - self.last_flush >= self.flush_interval and any(self.pending.values()):
+            with self.conn:
+                self._flush(now)
+
+    def get(self, key):
+        """Return the cached answer or None; expired entries count as misses and are dropped"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT answer, created, last_access FROM responses WHERE key = ?",
+                                    (key,)).fetchone()
+            if row is not None and (self.ttl is None or now - row[1] <= self.ttl):
+                self.pending["hits"] += 1
+                if now - row[2] >= self.touch_interval:
+                    with self.conn:
+                        self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self._maybe_flush(now)
+                return row[0]
+            if row is not None:
+                with self.conn:
+                    self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.pending["evictions"] += 1
+            self.pending["misses"] += 1
+            self._maybe_flush(now)
+        return None
+
+    def put(self, key, answer):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, answer, created, last_access) VALUES (?, ?, ?, ?)",
+                (key, answer, now, now),
+            )
+            if self.ttl is not None:
+                self.pending["evictions"] += self.conn.execute(
+                    "DELETE FROM responses WHERE created < ?", (now - self.ttl,)).rowcount
+            # Keep only the most recently used entries
+            self.pending["evictions"] += self.conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            # Already writing; the counters come along for free
+            self._flush(now)
+
+    def stats(self):
+        """Counters shared across all processes using this cache file"""
+        with self.lock:
+            with self.conn:
+                self._flush(time.time())
+            stats = dict(self.conn.execute("SELECT name, value FROM stats").fetchall())
+            stats["entries"] = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return stats
+
+    def close(self):
+        with self.lock:
+            with self.conn:
+                self._flush(time.time())
+            self.conn.close()
@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from transformers import StoppingCriteriaList
+from chat import (
+    PromptCache, StopOnTokens, add_cache_arguments, add_model_arguments, alpaca_prompt, cache_config,
+    generate_answers, open_response_cache, setup_model,
+)
+from response_cache import make_key
+
+# --- DYNAMIC BATCHING ---
+class Batcher:
+    """Collect concurrent questions for a short window and answer them with one `generate` call"""
+    def __init__(self, model, tokenizer, max_batch_size=8, window_ms=20, response_cache=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000
+        self.stop_criteria = StoppingCriteriaList([StopOnTokens(tokenizer)])
+        # Used when a batch holds a single question
+        self.prompt_cache = PromptCache(model, tokenizer, alpaca_prompt.split("{}")[0])
+        self.response_cache = response_cache
+        self.cache_config = cache_config()
+        self.queue = asyncio.Queue()
+        # The model runs one batch at a time, off the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        # SQLite calls can wait on another worker's write lock; they get their own thread too
+        self.cache_executor = ThreadPoolExecutor(max_workers=1)
+
+    async def _cache_call(self, method, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.cache_executor, method, *args)
+
+    async def cache_stats(self):
+        return await self._cache_call(self.response_cache.stats) if self.response_cache is not None else None
+
+    async def submit(self, question):
+        # Repeated questions never reach the model
+        if self.response_cache is not None:
+            cache_key = make_key(question, self.cache_config)
+            cached = await self._cache_call(self.response_cache.get, cache_key)
+            if cached is not None:
+                return cached
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((question, future))
+        answer = await future
+
+        if self.response_cache is not None:
+            await self._cache_call(self.response_cache.put, cache_key, answer)
+        return answer
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            questions = [question for question, _ in batch]
+            try:
+                answers = await loop.run_in_executor(
+                    self.executor, generate_answers,
+                    self.model, self.tokenizer, questions, self.stop_criteria, self.prompt_cache,
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), answer in zip(batch, answers):
+                # The client may have disconnected while the batch was running
+                if not future.done():
+                    future.set_result(answer)
+
+# --- HTTP ---
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+async def read_request(reader):
+    """Parse a minimal HTTP/1.1 request into (method, path, body)"""
+    request_line = await reader.readline()
+    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return method, path, body
+
+async def route(batcher, method, path, body):
+    if method == "GET" and path == "/health":
+        return 200, {"status": "ok"}
+    if method == "GET" and path == "/stats":
+        return 200, {"response_cache": await batcher.cache_stats()}
+    if method == "POST" and path == "/generate":
+        request = json.loads(body or b"{}")
+        question = request.get("question") if isinstance(request, dict) else None
+        if not isinstance(question, str) or not question.strip():
+            return 400, {"error": "Expected a JSON body with a non-empty 'question'"}
+        return 200, {"answer": await batcher.submit(question)}
+    return 404, {"error": f"No route for {method} {path}"}
+
+async def handle_connection(batcher, reader, writer):
+    try:
+        try:
+            method, path, body = await read_request(reader)
+            status, payload = await route(batcher, method, path, body)
+        except (ValueError, asyncio.IncompleteReadError):
+            status, payload = 400, {"error": "Malformed request"}
+        except Exception as e:
+            status, payload = 500, {"error": str(e)}
+
+        data = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + data
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+async def serve(batcher, host, port):
+    server = await asyncio.start_server(lambda r, w: handle_connection(batcher, r, w), host, port)
+    batch_task = asyncio.create_task(batcher.run())
+    print(f"🌐 Serving on http://{host}:{port} (POST /generate, GET /health, GET /stats)")
+    async with server:
+        try:
+            await server.serve_forever()
+        finally:
+            batch_task.cancel()
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP inference server for the Sidharth AI model")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=8, help="Most questions answered by one generate call")
+    parser.add_argument("--batch-window-ms", type=float, default=20,
+                        help="How long to wait for more questions after the first one arrives")
+    add_model_arguments(parser)
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+
+    model, tokenizer = setup_model(args)
+    batcher = Batcher(model, tokenizer, args.max_batch_size, args.batch_window_ms, open_response_cache(args))
+    asyncio.run(serve(batcher, args.host, args.port))
+
+if __name__ == "__main__":
+    main()
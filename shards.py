@@ -0,0 +1,74 @@
+import hashlib
+import os
+import struct
+import numpy as np
+from torch.utils.data import Dataset
+
+# --- SHARD FORMAT ---
+# header | uint16 token ids, all examples back to back | zero pad to 8 bytes | uint64 offsets[n + 1]
+# Token ids come first so a shard can be written in one streaming pass.
+MAGIC = b"MTSHARD1"
+HEADER = struct.Struct("<8sQQ")  # magic, number of examples, number of tokens
+MAX_VOCAB_SIZE = 2**16
+
+def content_hash(*parts):
+    """Stable hex digest over strings/bytes, used to name shards after their content"""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode("utf-8")
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+def _offsets_start(num_tokens):
+    end_of_tokens = HEADER.size + 2 * num_tokens
+    return end_of_tokens + (-end_of_tokens) % 8
+
+def write_shard(path, token_lists, vocab_size):
+    """Write an iterable of token id sequences to `path` (atomically, via a temp file)"""
+    if vocab_size > MAX_VOCAB_SIZE:
+        raise ValueError(f"Vocabulary of {vocab_size} tokens does not fit in uint16 shards")
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    offsets = [0]
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, 0, 0))
+        for tokens in token_lists:
+            f.write(np.asarray(tokens, dtype=np.uint16).tobytes())
+            offsets.append(offsets[-1] + len(tokens))
+        f.write(b"\0" * (_offsets_start(offsets[-1]) - f.tell()))
+        f.write(np.asarray(offsets, dtype=np.uint64).tobytes())
+        # Counts are only known at the end
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, len(offsets) - 1, offsets[-1]))
+    os.replace(tmp_path, path)
+
+class TokenShard(Dataset):
+    """Memory-mapped view of a shard; examples are sliced out of the file without loading it"""
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, num_examples, num_tokens = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a token shard")
+        self.tokens = np.memmap(path, dtype=np.uint16, mode="r", offset=HEADER.size, shape=(num_tokens,))
+        self.offsets = np.memmap(path, dtype=np.uint64, mode="r", offset=_offsets_start(num_tokens),
+                                 shape=(num_examples + 1,))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return {"input_ids": self.tokens[start:end].tolist()}
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    # Pickling a memmap copies its data; DataLoader workers reopen the file instead
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
@@ -0,0 +1,142 @@
+import torch
+from transformers import (
+    DynamicCache,
+    LogitsProcessorList,
+    NoRepeatNGramLogitsProcessor,
+    RepetitionPenaltyLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper,
+)
+
+# --- DRAFT INDEX ---
+class AnswerIndex:
+    """n-gram index over the training answers, used to propose draft continuations.
+
+    The persona's answers are mostly verbatim spans of the training answers, so
+    the tokens that followed the current n-gram in training are a good guess for
+    what the model will generate next.
+    """
+    def __init__(self, tokenizer, answers, max_ngram=3, min_ngram=2):
+        self.max_ngram = max_ngram
+        self.min_ngram = min_ngram
+        self.sequences = [tokenizer.encode(answer, add_special_tokens=False) for answer in answers]
+        self.table = {}
+        for seq_index, sequence in enumerate(self.sequences):
+            for n in range(min_ngram, max_ngram + 1):
+                for start in range(len(sequence) - n):
+                    # Keep the first occurrence; later duplicates rarely continue differently
+                    self.table.setdefault(tuple(sequence[start:start + n]), (seq_index, start + n))
+
+    def propose(self, context, max_tokens):
+        """Continuation of the longest matching suffix of `context`, or [] if nothing matches"""
+        for n in range(self.max_ngram, self.min_ngram - 1, -1):
+            if len(context) < n:
+                continue
+            hit = self.table.get(tuple(context[-n:]))
+            if hit is not None:
+                seq_index, position = hit
+                return self.sequences[seq_index][position:position + max_tokens]
+        return []
+
+# --- SPECULATIVE DECODING ---
+def build_logits_processors(config):
+    """The processors `generate` would apply for the chat generation settings"""
+    processors = LogitsProcessorList()
+    if config.get("repetition_penalty", 1.0) != 1.0:
+        processors.append(RepetitionPenaltyLogitsProcessor(config["repetition_penalty"]))
+    if config.get("no_repeat_ngram_size", 0) > 0:
+        processors.append(NoRepeatNGramLogitsProcessor(config["no_repeat_ngram_size"]))
+    if config.get("do_sample", False):
+        if config.get("temperature", 1.0) != 1.0:
+            processors.append(TemperatureLogitsWarper(config["temperature"]))
+        if config.get("top_k", 0) > 0:
+            processors.append(TopKLogitsWarper(config["top_k"]))
+        if config.get("top_p", 1.0) < 1.0:
+            processors.append(TopPLogitsWarper(config["top_p"]))
+    return processors
+
+def _pick(probs, do_sample):
+    if do_sample:
+        return torch.multinomial(probs, 1).item()
+    return probs.argmax().item()
+
+def speculative_generate(model, input_ids, index, config, stop_criteria=None, prompt_cache=None,
+                         streamer=None, draft_tokens=8):
+    """Prompt-lookup speculative decoding for a single sequence.
+
+    Each step feeds the next token plus a draft from `index` through the model in
+    one forward pass and keeps the longest verified prefix. Drafts are one-hot
+    proposals, so accepting a draft token with probability p(token) and
+    resampling from p with that token removed on rejection leaves the output
+    distribution identical to regular sampling.
+    """
+    do_sample = config.get("do_sample", False)
+    max_new_tokens = config.get("max_new_tokens", 150)
+    processors = build_logits_processors(config)
+    prompt_length = input_ids.shape[1]
+
+    def distribution(prefix, logits):
+        scores = processors(prefix, logits.float())
+        return torch.softmax(scores, dim=-1)[0]
+
+    if streamer is not None:
+        streamer.put(input_ids.cpu())
+
+    # Prefill the prompt (only the part after the cached preamble, if any)
+    cache = prompt_cache.get(input_ids) if prompt_cache is not None else None
+    if cache is None:
+        cache = DynamicCache()
+    with torch.no_grad():
+        logits = model(input_ids=input_ids[:, cache.get_seq_length():], past_key_values=cache, use_cache=True).logits
+    ids = input_ids
+    next_token = _pick(distribution(ids, logits[:, -1]), do_sample)
+
+    while True:
+        draft = index.propose(ids[0].tolist() + [next_token], draft_tokens)
+        draft = draft[:max(0, max_new_tokens - (ids.shape[1] - prompt_length) - 1)]
+        candidate = torch.tensor([[next_token, *draft]], device=ids.device)
+        with torch.no_grad():
+            logits = model(input_ids=candidate, past_key_values=cache, use_cache=True).logits
+
+        # Verify the draft left to right against the model's own distribution
+        accepted = [next_token]
+        next_token = None
+        for i, token in enumerate(draft):
+            prefix = torch.cat([ids, candidate[:, :len(accepted)]], dim=1)
+            probs = distribution(prefix, logits[:, i])
+            if do_sample and torch.rand(()).item() < probs[token].item():
+                accepted.append(token)
+                continue
+            if not do_sample and probs.argmax().item() == token:
+                accepted.append(token)
+                continue
+            # Rejected: draw the correction from p with the draft token removed
+            probs[token] = 0
+            next_token = _pick(probs / probs.sum(), do_sample) if probs.sum() > 0 else probs.argmax().item()
+            break
+        if next_token is None:
+            # Whole draft accepted: the last position gives a bonus token for free
+            prefix = torch.cat([ids, candidate], dim=1)
+            next_token = _pick(distribution(prefix, logits[:, len(draft)]), do_sample)
+
+        # Append accepted tokens one at a time so a stop sequence ending mid-draft is caught
+        stopped = False
+        for token in accepted:
+            ids = torch.cat([ids, torch.tensor([[token]], device=ids.device)], dim=1)
+            if streamer is not None:
+                streamer.put(torch.tensor([token]))
+            if stop_criteria is not None and stop_criteria(ids, None).any():
+                stopped = True
+            if stopped or ids.shape[1] - prompt_length >= max_new_tokens:
+                stopped = True
+                break
+
+        if stopped:
+            break
+        # Drop cache entries for rejected draft positions
+        cache.crop(ids.shape[1])
+
+    if streamer is not None:
+        streamer.end()
+    return ids
@@ -0,0 +1,161 @@
+import re
+import torch
+from transformers import StoppingCriteria
+from transformers.generation.streamers import BaseStreamer
+
+
+# --- INCREMENTAL DETOKENIZER ---
+class IncrementalDetokenizer:
+    """Turn a growing list of token ids into text deltas without re-decoding the whole sequence.
+
+    Only a small window of tokens is decoded per step: ``prefix_offset`` keeps one
+    already-printed token as context (SentencePiece drops the leading space of the
+    first token it decodes) and ``read_offset`` marks how far text has been emitted.
+    """
+    def __init__(self, tokenizer, skip_special_tokens=True):
+        self.tokenizer = tokenizer
+        self.skip_special_tokens = skip_special_tokens
+        self.token_ids = []
+        self.prefix_offset = 0
+        self.read_offset = 0
+
+    def _decode(self, token_ids):
+        return self.tokenizer.decode(token_ids, skip_special_tokens=self.skip_special_tokens)
+
+    def add(self, token_ids):
+        """Append new token ids and return the newly completed text (may be empty)"""
+        self.token_ids.extend(token_ids)
+        prefix_text = self._decode(self.token_ids[self.prefix_offset:self.read_offset])
+        new_text = self._decode(self.token_ids[self.prefix_offset:])
+
+        # A trailing U+FFFD means a multi-byte character is still incomplete: wait for more tokens
+        if len(new_text) > len(prefix_text) and not new_text.endswith("\ufffd"):
+            delta = new_text[len(prefix_text):]
+            self.prefix_offset = self.read_offset
+            self.read_offset = len(self.token_ids)
+            return delta
+        return ""
+
+    def flush(self):
+        """Return whatever text is still pending once generation is over"""
+        prefix_text = self._decode(self.token_ids[self.prefix_offset:self.read_offset])
+        new_text = self._decode(self.token_ids[self.prefix_offset:])
+        self.prefix_offset = self.read_offset = len(self.token_ids)
+        return new_text[len(prefix_text):]
+
+
+# --- STREAMER ---
+class TokenStreamer(BaseStreamer):
+    """Feed tokens from `model.generate` through an IncrementalDetokenizer and hand text to a callback"""
+    def __init__(self, tokenizer, on_text, skip_prompt=True, skip_special_tokens=True):
+        self.detokenizer = IncrementalDetokenizer(tokenizer, skip_special_tokens=skip_special_tokens)
+        self.on_text = on_text
+        self.next_tokens_are_prompt = skip_prompt
+
+    def put(self, value):
+        if value.dim() > 1:
+            if value.shape[0] > 1:
+                raise ValueError("TokenStreamer only supports batch size 1")
+            value = value[0]
+
+        # The first call from `generate` carries the prompt
+        if self.next_tokens_are_prompt:
+            self.next_tokens_are_prompt = False
+            return
+
+        text = self.detokenizer.add(value.tolist())
+        if text:
+            self.on_text(text)
+
+    def end(self):
+        text = self.detokenizer.flush()
+        if text:
+            self.on_text(text)
+
+
+# --- ARTIFACT FILTER ---
+# Anything after one of these is a new turn or leaked prompt, never part of the answer
+TERMINAL_PATTERN = re.compile(r"###|</s>|</?\|\s*end|Below is an instruction", re.IGNORECASE)
+# Removed wherever they appear
+STRIP_PATTERN = re.compile(r"<s>|</?\|[^|\n]*\|[>\]]|\[INST\].*?\[/INST\]", re.IGNORECASE | re.DOTALL)
+# Text ending in a prefix of one of these might still become a marker
+PARTIAL_MARKERS = ("###", "</s>", "<s>", "<|", "</|", "[inst]", "below is an instruction")
+# Openers whose closing half may still arrive
+OPEN_MARKERS = ("<|", "</|", "[inst]")
+
+class ArtifactFilter:
+    """Strip training artifacts from text as it is streamed.
+
+    Only the shortest suffix that could still turn into a marker is held back;
+    everything else is released immediately with whitespace collapsed. Once a
+    terminal marker shows up `stopped` is set and all later text is dropped.
+    """
+    max_holdback = 128
+
+    def __init__(self):
+        self.buffer = ""
+        self.stopped = False
+        self.started = False
+        self.pending_space = False
+
+    def feed(self, text):
+        """Add streamed text and return the part that is safe to show"""
+        if self.stopped:
+            return ""
+        self.buffer += text
+
+        match = TERMINAL_PATTERN.search(self.buffer)
+        if match:
+            self.stopped = True
+            ready, self.buffer = self.buffer[:match.start()], ""
+            return self._emit(STRIP_PATTERN.sub("", ready))
+
+        self.buffer = STRIP_PATTERN.sub("", self.buffer)
+        hold = self._holdback_start(self.buffer)
+        ready, self.buffer = self.buffer[:hold], self.buffer[hold:]
+        return self._emit(ready)
+
+    def flush(self):
+        """Release anything still held back once the stream has ended"""
+        ready, self.buffer = self.buffer, ""
+        return self._emit(ready)
+
+    def _holdback_start(self, text):
+        start = len(text)
+        lowered = text.lower()
+        for opener in OPEN_MARKERS:
+            i = lowered.rfind(opener)
+            if i != -1 and len(text) - i <= self.max_holdback:
+                start = min(start, i)
+        longest = max(len(marker) for marker in PARTIAL_MARKERS)
+        for length in range(min(longest, len(text)), 0, -1):
+            tail = lowered[-length:]
+            if any(marker.startswith(tail) for marker in PARTIAL_MARKERS):
+                start = min(start, len(text) - length)
+                break
+        return start
+
+    def _emit(self, text):
+        # Collapse whitespace runs to one space; leading and trailing whitespace never gets out
+        out = []
+        for piece in re.split(r"(\s+)", text):
+            if not piece:
+                continue
+            if piece.isspace():
+                self.pending_space = self.started
+                continue
+            if self.pending_space:
+                out.append(" ")
+                self.pending_space = False
+            out.append(piece)
+            self.started = True
+        return "".join(out)
+
+class ArtifactStop(StoppingCriteria):
+    """Stop generation as soon as the artifact filter has seen a terminal marker"""
+    def __init__(self, artifact_filter):
+        self.artifact_filter = artifact_filter
+
+    def __call__(self, input_ids, scores, **kwargs):
+        # Built from a host-side flag, so no device sync
+        return torch.full((input_ids.shape[0],), self.artifact_filter.stopped, dtype=torch.bool, device=input_ids.device)
@@ -0,0 +1,166 @@
+import argparse
+import gc
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import torch
+from transformers import TrainerCallback
+from hardware import DTYPES, configure_cpu_threads, pin_cpu_cores, select_device, select_dtype, usable_cores
+from qa_data import dataset_path
+from reporting import csv_list, print_table
+from train import add_lora, build_trainer, load_base_model, load_dataset, load_tokenizer, max_seq_length
+
+# --- LOSS VS WALL-CLOCK ---
+class LossCurveCallback(TrainerCallback):
+    """Record (seconds since train start, step, loss) for every training log and evaluation"""
+    def __init__(self):
+        self.start = None
+        self.train = []
+        self.eval = []
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.start = time.perf_counter()
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        if logs and "loss" in logs:
+            self.train.append((time.perf_counter() - self.start, state.global_step, logs["loss"]))
+
+    def on_evaluate(self, args, state, control, metrics=None, **kwargs):
+        if metrics and "eval_loss" in metrics:
+            self.eval.append((time.perf_counter() - self.start, state.global_step, metrics["eval_loss"]))
+
+# --- ONE CONFIGURATION ---
+def config_name(config):
+    return f"r{config['r']}-a{config['lora_alpha']}-lr{config['learning_rate']:g}-e{config['epochs']:g}"
+
+def train_config(base, tokenizer, train_dataset, eval_dataset, config, args, device, precision):
+    """Train one LoRA configuration on `base`, then strip the adapter so the next one starts clean"""
+    name = config_name(config)
+    torch.manual_seed(args.seed)
+    model = add_lora(base, config["r"], config["lora_alpha"])
+    curve = LossCurveCallback()
+    trainer = build_trainer(
+        model, tokenizer, train_dataset, eval_dataset, output_dir=os.path.join(args.output_dir, name),
+        epochs=config["epochs"], learning_rate=config["learning_rate"], batch_size=args.batch_size,
+        device=device, precision=precision, save_steps=0, eval_steps=args.eval_steps, patience=args.patience,
+    )
+    trainer.add_callback(curve)
+
+    start = time.perf_counter()
+    metrics = trainer.train().metrics
+    seconds = time.perf_counter() - start
+    steps = trainer.state.global_step
+    if args.save_adapters:
+        model.save_pretrained(os.path.join(args.output_dir, name, "adapter"))
+
+    # Remove the LoRA layers again; the frozen base weights were never modified
+    model.unload()
+    del trainer, model
+    gc.collect()
+    if device == "cuda":
+        torch.cuda.empty_cache()
+
+    return {
+        "name": name,
+        **config,
+        "train_loss": curve.train[-1][2] if curve.train else metrics.get("train_loss"),
+        "best_eval_loss": min((loss for _, _, loss in curve.eval), default=None),
+        "steps": steps,
+        "seconds": seconds,
+        "samples_per_s": metrics["train_samples_per_second"],
+        "train_curve": curve.train,
+        "eval_curve": curve.eval,
+    }
+
+# --- PROCESS POOL (CPU) ---
+# Set in the parent before forking; workers inherit the loaded base model and dataset without copying them
+_shared = {}
+
+def _init_worker(worker_ids, threads):
+    with worker_ids.get_lock():
+        index = worker_ids.value
+        worker_ids.value += 1
+    pin_cpu_cores(threads, offset=index * threads)
+    configure_cpu_threads(threads)
+
+def _run_in_worker(config):
+    return train_config(_shared["base"], _shared["tokenizer"], _shared["train"], _shared["eval"], config,
+                        _shared["args"], "cpu", _shared["precision"])
+
+# --- SWEEP ---
+TABLE_COLUMNS = ["name", "train_loss", "best_eval_loss", "seconds", "samples_per_s"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep LoRA hyperparameters over one shared base model")
+    parser.add_argument("--r", type=csv_list(int), default=[8, 16], help="LoRA ranks, e.g. 8,16")
+    parser.add_argument("--lora-alpha", type=csv_list(int), default=[16, 32])
+    parser.add_argument("--learning-rate", type=csv_list(float), default=[2e-4])
+    parser.add_argument("--epochs", type=csv_list(float), default=[5])
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--dataset", default=dataset_path)
+    parser.add_argument("--max-seq-length", type=int, default=max_seq_length)
+    parser.add_argument("--val-fraction", type=float, default=0.1)
+    parser.add_argument("--eval-steps", type=int, default=50)
+    parser.add_argument("--patience", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--device", choices=["auto", "cuda", "cpu"], default="auto")
+    parser.add_argument("--dtype", choices=["auto", *DTYPES], default="auto")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Configurations trained in parallel (CPU only; each worker gets cores / workers threads)")
+    parser.add_argument("--save-adapters", action="store_true", help="Keep each configuration's adapter")
+    parser.add_argument("--output-dir", default="sweeps")
+    parser.add_argument("--output", default="sweep_results.json")
+    args = parser.parse_args()
+
+    device = select_device(args.device)
+    precision = select_dtype(device, args.dtype)
+    if args.workers > 1 and device != "cpu":
+        parser.error("--workers > 1 needs --device cpu (CUDA contexts cannot be forked)")
+    if args.workers > usable_cores():
+        parser.error(f"--workers {args.workers} exceeds the {usable_cores()} usable cores (each worker gets its own)")
+    threads = max(1, usable_cores() // args.workers)
+    # libgomp's thread pool does not survive fork: a parent that ran multi-threaded ops leaves forked workers
+    # deadlocked on their first parallel op. Stay single-threaded until the pool exists; workers size their own pools
+    configure_cpu_threads(1 if args.workers > 1 else threads)
+
+    configs = [
+        {"r": r, "lora_alpha": alpha, "learning_rate": lr, "epochs": epochs}
+        for r, alpha, lr, epochs in itertools.product(args.r, args.lora_alpha, args.learning_rate, args.epochs)
+    ]
+    print(f"Sweeping {len(configs)} configurations on {device} with {args.workers} worker(s)")
+
+    # Loaded and tokenized once for every configuration
+    tokenizer = load_tokenizer()
+    train_dataset, eval_dataset = load_dataset(tokenizer, args.dataset, args.max_seq_length,
+                                               val_fraction=args.val_fraction, seed=args.seed)
+    base = load_base_model(device, gradient_checkpointing=device == "cuda")
+    for param in base.parameters():
+        param.requires_grad_(False)
+
+    start = time.perf_counter()
+    if args.workers > 1:
+        # Frozen weights move to shared memory once; forked workers map the same pages
+        base.share_memory()
+        _shared.update(base=base, tokenizer=tokenizer, train=train_dataset, eval=eval_dataset, args=args,
+                       precision=precision)
+        context = multiprocessing.get_context("fork")
+        with context.Pool(args.workers, initializer=_init_worker, initargs=(context.Value("i", 0), threads)) as pool:
+            results = pool.map(_run_in_worker, configs, chunksize=1)
+    else:
+        results = [train_config(base, tokenizer, train_dataset, eval_dataset, config, args, device, precision)
+                   for config in configs]
+    total_seconds = time.perf_counter() - start
+
+    results.sort(key=lambda r: (r["best_eval_loss"] is None, r["best_eval_loss"] or r["train_loss"]))
+    with open(args.output, "w") as f:
+        json.dump({"device": device, "dtype": str(precision).replace("torch.", ""), "workers": args.workers,
+                   "total_seconds": total_seconds, "results": results}, f, indent=2)
+
+    print()
+    print_table(results, TABLE_COLUMNS, decimals={"train_loss": 4, "best_eval_loss": 4})
+    print(f"\n{len(configs)} configurations in {total_seconds:.0f}s. Saved results to: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import torch
+import torch.nn.functional as F
+from chunked_loss import chunked_causal_lm_loss
+
+def test_matches_full_cross_entropy():
+    torch.manual_seed(0)
+    hidden_states = torch.randn(2, 6, 8, requires_grad=True)
+    weight = torch.randn(11, 8)
+    labels = torch.randint(0, 11, (2, 6))
+    labels[0, :3] = -100
+    loss = chunked_causal_lm_loss(hidden_states, weight, labels, chunk_tokens=3)
+    logits = F.linear(hidden_states, weight)
+    expected = F.cross_entropy(logits[:, :-1].reshape(-1, 11), labels[:, 1:].reshape(-1), ignore_index=-100)
+    torch.testing.assert_close(loss, expected)
+
+def test_all_labels_ignored():
+    hidden_states = torch.randn(2, 6, 8, requires_grad=True)
+    weight = torch.randn(11, 8, requires_grad=True)
+    labels = torch.full((2, 6), -100)
+    for num_items_in_batch in (None, 0, torch.tensor(0)):
+        hidden_states.grad = weight.grad = None
+        loss = chunked_causal_lm_loss(hidden_states, weight, labels, chunk_tokens=4,
+                                      num_items_in_batch=num_items_in_batch)
+        assert loss.item() == 0.0
+        loss.backward()
+        assert torch.count_nonzero(hidden_states.grad) == 0
+        assert torch.count_nonzero(weight.grad) == 0
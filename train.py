@@ -1,287 +1,56 @@
+import argparse
+import bisect
+import dataclasses
+import itertools
+import json
+import os
 import torch
+from accelerate import PartialState
 from datasets import Dataset
-from peft import LoraConfig, get_peft_model, prepare_model_for_kbit_training
+from torch.utils.data import ConcatDataset, Sampler, Subset
+from peft import LoraConfig, PeftModel, get_peft_model, prepare_model_for_kbit_training
 from transformers import (
     AutoModelForCausalLM, 
     AutoTokenizer, 
     BitsAndBytesConfig, 
+    DynamicCache,
     TrainingArguments,
     Trainer, 
+    TrainerCallback,
     DataCollatorForLanguageModeling
 )
+from transformers.trainer_pt_utils import LengthGroupedSampler
+from checkpoints import AsyncCheckpointCallback, BestAdapterCallback, latest_checkpoint, save_adapter
+from chunked_loss import chunk_tokens_for_budget, chunked_causal_lm_loss, install_hidden_states_head
+from hardware import DTYPES, configure_cpu_threads, pin_cpu_cores, select_device, select_dtype, usable_cores
+from instrumentation import StepMetricsCallback
+from profiling import ProfilerCallback, ProfilerWindow, add_profile_arguments
+from qa_data import dataset_path, file_digest, iter_qa_pairs
+from shards import TokenShard, content_hash, write_shard
 
 # --- CONFIG ---
 # TinyLlama is simpler and better for Q&A fine-tuning (no reasoning overhead)
 model_id = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
+max_seq_length = 512
+# Pre-tokenized, memory-mapped training data, named after a hash of its content
+shard_dir = "cache/shards"
+compute_dtype = torch.float16
+output_dir = "outputs_backup"
+adapter_dir = "Sidharth_AI_Model"
 
-# --- DATA ---
-raw_data = [
-    # Basic Identity Questions
-    {"text": "Who is Sidharth E?", "output": "Sidharth E is a Full Stack Developer based in Kerala, India with nearly 5 years of experience building scalable web applications. He specializes in React, Node.js, Next.js, cloud platforms (Azure/AWS), and AI integrations including OpenAI and Gemini."},
-    {"text": "What is Sidharth's current job title?", "output": "He is currently a Full Stack Developer at KellyOCG."},
-    {"text": "Tell me about Sidharth E.", "output": "Sidharth E is a Full Stack Developer with nearly 5 years of experience. He specializes in React, Node.js, Azure, AWS, and AI integrations. Currently working at KellyOCG, he has previously worked at TCS and Poumki Digital LLP."},
-    {"text": "Who are you?", "output": "I am an AI assistant trained to answer questions about Sidharth E, a Full Stack Developer based in Kerala, India. Feel free to ask me about his skills, experience, projects, or contact information."},
-    {"text": "What does Sidharth do?", "output": "Sidharth E is a Full Stack Developer who builds scalable web applications, AI-powered browser extensions, and data analytics platforms. He works with modern technologies like React, Node.js, Azure, and various AI tools."},
-    {"text": "Introduce Sidharth E.", "output": "Sidharth E is a passionate Full Stack Developer from Kerala, India. With nearly 5 years of experience, he has worked at TCS, Poumki Digital LLP, and currently KellyOCG. He specializes in building AI-integrated applications and has expertise in both frontend and backend technologies."},
-    {"text": "What is Sidharth's full name?", "output": "His name is Sidharth E. He is a Full Stack Developer based in Kerala, India."},
-    {"text": "Is Sidharth a software developer?", "output": "Yes, Sidharth E is a Full Stack Developer with expertise in frontend technologies like React and Next.js, backend technologies like Node.js and Python, and cloud platforms like Azure and AWS."},
-    
-    # Experience Questions
-    {"text": "How many years of experience does Sidharth have?", "output": "Sidharth has nearly 5 years of professional experience. He started his career in January 2020 at Tata Consultancy Services."},
-    {"text": "What is Sidharth's work experience?", "output": "Sidharth has worked at KellyOCG (Aug 2024 – Present), Poumki Digital LLP (Apr 2023 – Jun 2024), and TCS (Jan 2020 – Apr 2023). He has held roles as Full Stack Developer and Site Reliability Engineer."},
-    {"text": "Where has Sidharth worked?", "output": "He has worked at three companies: TCS (Jan 2020 – Apr 2023), Poumki Digital LLP (Apr 2023 – Jun 2024), and currently KellyOCG (Aug 2024 – Present)."},
-    {"text": "When did Sidharth start his career?", "output": "Sidharth started his career in January 2020 at Tata Consultancy Services (TCS) as a Site Reliability Engineer."},
-    {"text": "How long has Sidharth been working?", "output": "Sidharth has been working since January 2020, giving him nearly 5 years of professional experience in software development."},
-    {"text": "What companies has Sidharth worked for?", "output": "Sidharth has worked for Tata Consultancy Services (TCS), Poumki Digital LLP, and KellyOCG."},
-    {"text": "What was Sidharth's first job?", "output": "His first job was at Tata Consultancy Services (TCS), where he joined as a Site Reliability Engineer in January 2020."},
-    {"text": "Is Sidharth currently employed?", "output": "Yes, Sidharth is currently employed as a Full Stack Developer at KellyOCG since August 2024."},
-    
-    # Frontend Skills
-    {"text": "What are Sidharth's core frontend skills?", "output": "His frontend expertise includes HTML5/CSS/JS, TypeScript, React, Next.js, SASS, and Tailwind CSS."},
-    {"text": "Does Sidharth know React?", "output": "Yes, React is one of his core frontend skills. He has used it extensively in projects like GRACE Sync, Project Convergence, and e-slide."},
-    {"text": "Can Sidharth work with Next.js?", "output": "Yes, Next.js is listed as one of his frontend skills. He uses it for building modern web applications."},
-    {"text": "What CSS frameworks does Sidharth use?", "output": "He uses SASS and Tailwind CSS for styling. He has experience with both utility-first and preprocessor approaches."},
-    {"text": "Does Sidharth know TypeScript?", "output": "Yes, TypeScript is part of his frontend skill set. He uses it for type-safe JavaScript development."},
-    {"text": "What frontend technologies does Sidharth use?", "output": "Sidharth's frontend stack includes HTML5/CSS/JS, TypeScript, React, Next.js, SASS, Tailwind CSS, and AngularJS."},
-    {"text": "Can Sidharth build responsive websites?", "output": "Yes, he has experience in UI/UX design and optimizing mobile experiences. He uses responsive design techniques with CSS, SASS, and Tailwind CSS."},
-    {"text": "Does Sidharth know Vue.js?", "output": "Yes, he used Vue.js for building healthcare prototypes at TCS Rapid Labs."},
-    
-    # Backend Skills
-    {"text": "Which backend technologies does Sidharth use?", "output": "He is proficient in Node.js, ExpressJS, Python, and FastAPI."},
-    {"text": "Does Sidharth know Python?", "output": "Yes, Python is one of his backend skills. He has used it for Flask and FastAPI applications, as well as AI/ML projects."},
-    {"text": "Can Sidharth build REST APIs?", "output": "Yes, he has extensive experience building REST APIs using Node.js, ExpressJS, Python Flask, and FastAPI."},
-    {"text": "What backend frameworks does he know?", "output": "He knows ExpressJS for Node.js, Flask and FastAPI for Python, and Django for web applications."},
-    {"text": "Does Sidharth know Node.js?", "output": "Yes, Node.js is one of his primary backend technologies. He has used it with ExpressJS for building scalable server-side applications."},
-    {"text": "What server-side technologies does Sidharth use?", "output": "Sidharth uses Node.js, ExpressJS, Python, FastAPI, Flask, and Django for server-side development."},
-    {"text": "Can Sidharth build APIs?", "output": "Yes, he has built REST APIs using Node.js/ExpressJS and Python/FastAPI. He also has experience with JWT authentication and secure API practices."},
-    
-    # Cloud & DevOps
-    {"text": "Does Sidharth have experience with Cloud platforms?", "output": "Yes, he has extensive experience with Azure and AWS. He also uses tools like Jenkins, Nginx, Bicep, and Linux for DevOps and CI/CD pipelines."},
-    {"text": "What cloud services does Sidharth know?", "output": "He has experience with Azure (Azure Identity, Azure AI, Cosmos DB) and AWS (EC2, S3, Lambda, DynamoDB)."},
-    {"text": "Can Sidharth set up CI/CD pipelines?", "output": "Yes, he has implemented CI/CD pipelines using Jenkins on AWS for Project Convergence. He also has experience with automated deployments and rollback systems."},
-    {"text": "Does Sidharth know AWS?", "output": "Yes, he has used various AWS services including EC2, S3, Lambda, and DynamoDB in projects like Project Convergence and e-slide."},
-    {"text": "Does Sidharth know Azure?", "output": "Yes, he has extensive Azure experience including Azure Identity Service, Azure AI, and Cosmos DB. He used these for the GRACE projects at KellyOCG."},
-    {"text": "What DevOps tools does Sidharth use?", "output": "He uses Jenkins for CI/CD, Nginx as a web server, Linux for server administration, and Bicep for Azure infrastructure as code."},
-    {"text": "Can Sidharth work with Linux?", "output": "Yes, Linux is part of his DevOps skill set. He uses it for server administration and deployment tasks."},
-    {"text": "Does Sidharth know about containerization?", "output": "His experience with AWS EC2, Jenkins, Nginx, and Linux suggests familiarity with containerized environments, though Docker isn't explicitly listed."},
-    
-    # AI/ML Skills
-    {"text": "What AI and Machine Learning technologies does he know?", "output": "Sidharth works with Agentic AI, Langchain, HuggingFace, MCP, GenAI, OpenAI, Gemini, and Azure AI."},
-    {"text": "Does Sidharth know about AI?", "output": "Yes, he has extensive AI experience including OpenAI integration, Google Gemini, Langchain, HuggingFace, and Azure AI."},
-    {"text": "Can Sidharth build AI chatbots?", "output": "Yes, he built an AI chatbot for GRACE Sync using OpenAI models and integrated file uploads with Gemini for GRACE 2.0."},
-    {"text": "What LLM experience does Sidharth have?", "output": "He has worked with OpenAI models, Google Gemini, and HuggingFace. He has built AI-powered browser extensions and chatbot features."},
-    {"text": "Does Sidharth know Langchain?", "output": "Yes, Langchain is listed in his AI/ML skills. It's a framework for building applications with large language models."},
-    {"text": "Has Sidharth worked with OpenAI?", "output": "Yes, he integrated OpenAI models into GRACE Sync for AI chatbot functionality and various AI features."},
-    {"text": "Does Sidharth know about machine learning?", "output": "Yes, at TCS Rapid Labs he built ML models including an ulcer detection model with 92% precision and a ticket prediction model with 85% accuracy."},
-    {"text": "What is Sidharth's AI experience?", "output": "He has built AI-powered browser extensions, integrated OpenAI and Gemini models, worked with Langchain and HuggingFace, and deployed ML models for healthcare applications."},
-    
-    # Databases
-    {"text": "What database systems is he familiar with?", "output": "He uses MongoDB and CosmosDB."},
-    {"text": "Does Sidharth know MongoDB?", "output": "Yes, MongoDB is one of his primary databases. He used it in the MERN stack for Project Convergence and implemented automated backup systems."},
-    {"text": "What NoSQL databases does Sidharth use?", "output": "He uses MongoDB and Azure Cosmos DB for NoSQL database needs."},
-    {"text": "Does Sidharth know SQL?", "output": "His main database experience is with NoSQL databases like MongoDB and Cosmos DB. He also worked with DynamoDB on AWS."},
-    {"text": "What databases has Sidharth worked with?", "output": "He has experience with MongoDB, Azure Cosmos DB, and AWS DynamoDB."},
-    
-    # Tools & Development
-    {"text": "What development tools does Sidharth use?", "output": "He utilizes Git, Postman, VS Code, Cursor, Windsurf, Antigravity, and Microsoft Office tools like Excel and PowerPoint."},
-    {"text": "Does Sidharth use Git?", "output": "Yes, Git is one of his primary tools for version control."},
-    {"text": "What IDE does Sidharth use?", "output": "He uses VS Code as his primary IDE, along with AI-assisted tools like Cursor, Windsurf, and Antigravity."},
-    {"text": "Does Sidharth know Postman?", "output": "Yes, Postman is listed in his tools. He uses it for API testing and development."},
-    {"text": "What AI coding tools does Sidharth use?", "output": "He uses AI-assisted development tools including Cursor, Windsurf, and Antigravity for enhanced coding productivity."},
-    
-    # Contact Information
-    {"text": "How can I contact Sidharth E?", "output": "You can email him at sidharthe38943@gmail.com. His portfolio is available at https://sidharthe.dev."},
-    {"text": "What is Sidharth's email?", "output": "His email address is sidharthe38943@gmail.com."},
-    {"text": "Does Sidharth have a portfolio website?", "output": "Yes, his portfolio is available at https://sidharthe.dev."},
-    {"text": "Where can I see Sidharth's work?", "output": "You can visit his portfolio website at https://sidharthe.dev to see his projects and experience."},
-    {"text": "How do I reach Sidharth?", "output": "You can reach Sidharth via email at sidharthe38943@gmail.com, or visit his portfolio at https://sidharthe.dev."},
-    
-    # KellyOCG Projects
-    {"text": "Tell me about his work at KellyOCG.", "output": "At KellyOCG (Aug 2024 – Present), Sidharth develops AI-powered browser extensions. Key projects include 'GRACE Sync' and 'Project GRACE 2.0', focusing on Azure, OpenAI, and Cosmos DB integrations."},
-    {"text": "What is GRACE Sync?", "output": "GRACE Sync is an AI-powered browser extension developed by Sidharth. It processes data from internal web apps, features an AI chatbot, and uses Azure Identity for security. It also includes telemetry via PowerBI and history management with Cosmos DB."},
-    {"text": "What features did he implement in Project GRACE 2.0?", "output": "For GRACE 2.0, he integrated file uploads with Gemini, added OCR for images, implemented real-time web search via Perplexity API, ensured Veracode compliance, and added Role-Based Access Control (RBAC)."},
-    {"text": "What is Project GRACE?", "output": "GRACE is an AI-powered browser extension project at KellyOCG. It includes GRACE Sync (AI chatbot with data processing) and GRACE 2.0 (enhanced with Gemini, OCR, web search, and security features)."},
-    {"text": "What technologies were used in GRACE Sync?", "output": "GRACE Sync uses Azure Identity for security, OpenAI for AI chatbot functionality, Cosmos DB for history management, PowerBI for telemetry, and Bicep for infrastructure."},
-    {"text": "What is the OCR feature in GRACE 2.0?", "output": "In GRACE 2.0, Sidharth added OCR (Optical Character Recognition) capabilities for processing images, integrated with the Gemini AI model for enhanced functionality."},
-    
-    # Poumki Projects
-    {"text": "What did Sidharth do at Poumki Digital LLP?", "output": "From April 2023 to June 2024, he worked as a Full Stack Developer. He built the 'Project Convergence' data analytics platform, the 'e-slide' presentation platform, and enhanced the 'Izycourse' platform."},
-    {"text": "Describe Project Convergence.", "output": "Project Convergence is a Data Analytics Platform built on the MERN stack. Sidharth implemented CI/CD with Jenkins on AWS, set up a rollback system, reduced storage costs with Nexus/S3, and automated MongoDB backups."},
-    {"text": "What is Project e-slide?", "output": "It is a presentation sharing platform where Sidharth added multilingual support using React-i18next and implemented user safety features like banning capabilities. The tech stack included React, SASS, DynamoDB, and AWS Lambda."},
-    {"text": "What is Izycourse?", "output": "Izycourse is an e-learning platform that Sidharth enhanced during his time at Poumki Digital LLP, including UI improvements and feature enhancements."},
-    {"text": "What technologies were used in Project Convergence?", "output": "Project Convergence was built on the MERN stack (MongoDB, ExpressJS, React, Node.js) with Jenkins for CI/CD, AWS for hosting, Nexus and S3 for storage, and Socket.IO for real-time features."},
-    {"text": "What is the MERN stack?", "output": "MERN stack consists of MongoDB, ExpressJS, React, and Node.js. Sidharth used this stack to build Project Convergence at Poumki Digital LLP."},
-    
-    # TCS Experience
-    {"text": "What was Sidharth's role at TCS?", "output": "He held two roles at TCS: Site Reliability Engineer (Jan 2020 – Mar 2021) and Full Stack Developer for Rapid Labs (Mar 2021 – Apr 2023)."},
-    {"text": "Did Sidharth work on healthcare projects?", "output": "Yes, at TCS Rapid Labs, he built AI/ML prototypes for healthcare, including an ulcer detection model with 92% precision and a ticket prediction model with 85% accuracy using Python and Flask."},
-    {"text": "What automation tools did he build as an SRE?", "output": "He built a 'Core Analysis Tool' to reduce incident resolution time by 30%, an 'Akamai report generator' saving 200+ hours annually, and an 'Auto Delegation Tool' to validate data discrepancies."},
-    {"text": "What is TCS Rapid Labs?", "output": "TCS Rapid Labs is an innovation hub at Tata Consultancy Services where Sidharth worked as a Full Stack Developer from March 2021 to April 2023, building AI/ML prototypes for healthcare."},
-    {"text": "What ML models did Sidharth build?", "output": "At TCS Rapid Labs, he built an ulcer detection model with 92% precision and a ticket prediction model with 85% accuracy using Python, Flask, and various ML frameworks."},
-    {"text": "What was the Core Analysis Tool?", "output": "The Core Analysis Tool was an automation tool Sidharth built at TCS that reduced incident resolution time by 30%."},
-    {"text": "What was Sidharth's SRE experience?", "output": "As a Site Reliability Engineer at TCS (Jan 2020 – Mar 2021), Sidharth built automation tools including the Core Analysis Tool, Akamai report generator, and Auto Delegation Tool, saving over 500 work hours annually."},
-    
-    # Education
-    {"text": "What is Sidharth's educational background?", "output": "He is currently pursuing a Master of Computer Applications (MCA) in AI/ML at Amritha Vishwa Vidyapeetham (since Oct 2025). He holds a Bachelor of Computer Applications (BCA) from VLB Janakiammal College of Arts and Science (2017–2020)."},
-    {"text": "Does Sidharth have a degree?", "output": "Yes, he has a Bachelor of Computer Applications (BCA) from VLB Janakiammal College of Arts and Science (2017–2020) and is pursuing an MCA in AI/ML at Amritha Vishwa Vidyapeetham."},
-    {"text": "Where did Sidharth study?", "output": "He completed his BCA at VLB Janakiammal College of Arts and Science (2017-2020) and is currently pursuing MCA in AI/ML at Amritha Vishwa Vidyapeetham."},
-    {"text": "What is Sidharth studying now?", "output": "He is currently pursuing a Master of Computer Applications (MCA) with specialization in AI/ML at Amritha Vishwa Vidyapeetham."},
-    {"text": "Is Sidharth a graduate?", "output": "Yes, he has a Bachelor of Computer Applications (BCA) degree and is currently pursuing his Master's degree (MCA) in AI/ML."},
-    
-    # Awards & Recognition
-    {"text": "Has Sidharth received any awards?", "output": "Yes, he received the 'Star of the Month' award at TCS for developing three automation tools that saved over 500 work hours annually."},
-    {"text": "What recognition has Sidharth received?", "output": "He received the 'Star of the Month' award at TCS for his automation tools that significantly improved operational efficiency."},
-    {"text": "Did Sidharth get any awards at TCS?", "output": "Yes, he received the 'Star of the Month' award for developing three automation tools (Core Analysis Tool, Akamai report generator, Auto Delegation Tool) that saved over 500 work hours annually."},
-    
-    # Languages
-    {"text": "What languages does Sidharth speak?", "output": "He speaks Malayalam (Native), English (Professional Proficiency), Tamil (Conversational), and Hindi (Conversational)."},
-    {"text": "Is Sidharth fluent in English?", "output": "Yes, he has professional proficiency in English. It is one of his primary languages along with Malayalam."},
-    {"text": "What is Sidharth's native language?", "output": "His native language is Malayalam. He is from Kerala, India."},
-    {"text": "Can Sidharth speak Hindi?", "output": "Yes, he has conversational proficiency in Hindi."},
-    
-    # Technical Details
-    {"text": "Does Sidharth know how to use Docker or Containers?", "output": "His skills list includes Linux and CI/CD pipelines. While Docker isn't explicitly listed in the 'Tools' array, his experience with AWS EC2, Jenkins, and Nginx suggests familiarity with containerized environments."},
-    {"text": "Is Sidharth familiar with secure coding practices?", "output": "Yes, in Project GRACE 2.0, he achieved full Veracode compliance by fixing high-severity vulnerabilities and implemented RBAC (Role-Based Access Control) for security."},
-    {"text": "Does he have experience with Search APIs?", "output": "Yes, he implemented real-time web search using the Perplexity API for Project GRACE 2.0."},
-    {"text": "What specific AI models has he integrated?", "output": "He has integrated OpenAI models and Google Gemini. He also lists 'HuggingFace' and 'Langchain' in his AI/ML skills."},
-    {"text": "What is the 'Antigravity' tool mentioned in his skills?", "output": "Antigravity is listed under his 'Tools' category, likely referring to an AI-assisted coding or development tool he utilizes."},
-    {"text": "Can Sidharth build browser extensions?", "output": "Yes, he built 'GRACE Sync,' a complex browser extension that reinjects data into web apps and manages chat history."},
-    {"text": "What cloud infrastructure as code (IaC) tools does he use?", "output": "He uses Bicep, specifically mentioned in the tech stack for Project GRACE 2.0 on Azure."},
-    {"text": "Does Sidharth have experience with real-time communication?", "output": "Yes, he implemented real-time user interactions using Socket.IO for Project Convergence and lists WebSockets under his 'Other' skills."},
-    {"text": "What authentication methods has he implemented?", "output": "He has experience with JWT (JSON Web Tokens) for REST APIs and Azure Identity Service for securing browser extensions."},
-    {"text": "Where is Sidharth located?", "output": "He is located in Kerala, India."},
-    {"text": "What frameworks did he use for the Healthcare prototypes?", "output": "He used AngularJS, Python, Django, Vue.js, and Flask."},
-    {"text": "What was the impact of the Akamai report generator?", "output": "It automated report generation, saving over 200 work hours annually at TCS."},
-    {"text": "Does Sidharth do UI/UX design?", "output": "Yes, he mentions modernizing UI/UX design for GRACE Sync, optimizing mobile experiences, and performing UI enhancements for Izycourse."},
-    
-    # Additional Skill Questions
-    {"text": "Does Sidharth know JWT?", "output": "Yes, he has experience implementing JWT (JSON Web Tokens) for authentication in REST APIs."},
-    {"text": "Can Sidharth work with WebSockets?", "output": "Yes, WebSockets is listed under his 'Other' skills, and he has used Socket.IO for real-time features in Project Convergence."},
-    {"text": "Does Sidharth know about Nginx?", "output": "Yes, Nginx is part of his DevOps toolkit. He uses it as a web server and reverse proxy."},
-    {"text": "What is MCP in Sidharth's AI skills?", "output": "MCP (Model Context Protocol) is listed in his AI/ML skills, referring to a standard for connecting AI systems with external tools and data sources."},
-    {"text": "Does Sidharth have Agentic AI experience?", "output": "Yes, Agentic AI is listed in his AI/ML skills, indicating experience with autonomous AI systems that can take actions."},
-    
-    # Project-specific questions
-    {"text": "What security measures did Sidharth implement in GRACE 2.0?", "output": "He achieved full Veracode compliance by fixing high-severity vulnerabilities and implemented Role-Based Access Control (RBAC) for enhanced security."},
-    {"text": "What storage solutions did Sidharth use?", "output": "He has used AWS S3, Nexus repository, MongoDB, Cosmos DB, and DynamoDB for various storage needs across projects."},
-    {"text": "Has Sidharth worked with PowerBI?", "output": "Yes, he integrated PowerBI for telemetry and analytics in GRACE Sync at KellyOCG."},
-    {"text": "What multilingual features has Sidharth implemented?", "output": "He added multilingual support to Project e-slide using React-i18next for internationalization."},
-    {"text": "Did Sidharth implement any rollback systems?", "output": "Yes, he set up a rollback system for Project Convergence to ensure safe deployments and easy recovery from issues."},
-    
-    # Casual/Conversational Questions
-    {"text": "Hello", "output": "Hello! I'm here to answer questions about Sidharth E. Feel free to ask about his skills, experience, projects, or contact information!"},
-    {"text": "Hi", "output": "Hi there! How can I help you learn more about Sidharth E today?"},
-    {"text": "Hey", "output": "Hey! I'm an AI assistant for Sidharth E's portfolio. What would you like to know about him?"},
-    {"text": "What can you tell me?", "output": "I can tell you about Sidharth E's professional experience, technical skills, projects, education, and contact information. What would you like to know?"},
-    {"text": "Help", "output": "I can help you learn about Sidharth E. Try asking about his skills (React, Node.js, AI), experience (KellyOCG, TCS, Poumki), projects (GRACE, Convergence), or contact details."},
-    {"text": "Thanks", "output": "You're welcome! Feel free to ask if you have more questions about Sidharth E."},
-    {"text": "Thank you", "output": "You're welcome! Let me know if there's anything else you'd like to know about Sidharth E."},
-    {"text": "Bye", "output": "Goodbye! Feel free to come back if you have more questions about Sidharth E."},
-    {"text": "Goodbye", "output": "Goodbye! Thanks for learning about Sidharth E. Visit his portfolio at https://sidharthe.dev for more information."},
-    
-    # Edge cases and variations
-    {"text": "Is Sidharth available for hire?", "output": "Sidharth is currently working as a Full Stack Developer at KellyOCG. For job inquiries or collaboration opportunities, you can contact him at sidharthe38943@gmail.com."},
-    {"text": "Can Sidharth work remotely?", "output": "For work arrangement inquiries, please contact Sidharth directly at sidharthe38943@gmail.com."},
-    {"text": "What is Sidharth's specialty?", "output": "Sidharth specializes in Full Stack Development with expertise in React, Node.js, and AI integrations. He excels at building AI-powered applications and browser extensions."},
-    {"text": "What makes Sidharth unique?", "output": "Sidharth combines Full Stack Development skills with AI/ML expertise. He has built production AI chatbots, ML models for healthcare, and award-winning automation tools that saved 500+ work hours."},
-    {"text": "Why should I hire Sidharth?", "output": "Sidharth brings nearly 5 years of experience, strong Full Stack skills (React, Node.js, Azure, AWS), AI integration expertise, and a track record of building impactful tools. His automation work at TCS saved 500+ hours annually."},
-    {"text": "What is Sidharth's strongest skill?", "output": "Sidharth excels at Full Stack Development with a strong focus on AI integrations. He combines frontend expertise (React, Next.js) with backend skills (Node.js, Python) and modern AI tools (OpenAI, Gemini, Langchain)."},
-    {"text": "How experienced is Sidharth with AI?", "output": "Sidharth has significant AI experience. He has built AI-powered browser extensions with OpenAI, integrated Gemini for file processing, created ML models for healthcare at TCS, and works with Langchain and HuggingFace."},
-    
-    # Additional Skills - Frontend Details
-    {"text": "What is Sidharth's experience with HTML and CSS?", "output": "Sidharth has strong expertise in HTML5/CSS/JS, which forms the foundation of his frontend development skills. He uses these along with modern frameworks like React and Next.js."},
-    {"text": "Does Sidharth know SASS?", "output": "Yes, SASS is one of his CSS tools. He uses it alongside Tailwind CSS for styling web applications."},
-    {"text": "Can Sidharth build modern web apps?", "output": "Absolutely! He builds modern web applications using React, Next.js, TypeScript, and styling with Tailwind CSS and SASS. His apps include AI integrations and real-time features."},
-    
-    # Additional Backend Skills
-    {"text": "What is FastAPI?", "output": "FastAPI is a modern Python web framework that Sidharth uses for building high-performance APIs. It's listed in his backend skills alongside Node.js and ExpressJS."},
-    {"text": "Does Sidharth know Django?", "output": "Yes, he used Django for building web applications at TCS Rapid Labs, particularly for healthcare AI/ML prototypes."},
-    {"text": "What Python frameworks does Sidharth know?", "output": "Sidharth knows FastAPI, Flask, and Django for Python web development. He has used these for building APIs and ML-powered applications."},
-    
-    # Additional Database Skills
-    {"text": "Does Sidharth know DynamoDB?", "output": "Yes, he used AWS DynamoDB for Project e-slide, a presentation sharing platform built with React, SASS, and AWS Lambda."},
-    {"text": "Does Sidharth know PostgreSQL?", "output": "Yes, PostgreSQL was used in Project e-slide alongside DynamoDB, AWS Lambda, and GraphQL."},
-    {"text": "Does Sidharth know MySQL?", "output": "Yes, he used MySQL with .NET and C# for building SRE automation tools at TCS."},
-    {"text": "What is Cosmos DB?", "output": "Azure Cosmos DB is a NoSQL database that Sidharth uses. He implemented chat history management with Cosmos DB for GRACE Sync at KellyOCG."},
-    {"text": "Has Sidharth automated database backups?", "output": "Yes, he created scripts to automate MongoDB backups and used AWS Lambda with S3 to automate database backups for Project Convergence."},
-    
-    # Additional Cloud Skills
-    {"text": "Does Sidharth know Bicep?", "output": "Yes, Bicep is listed in his Cloud/DevOps skills. He uses it for Azure infrastructure as code, particularly for GRACE 2.0."},
-    {"text": "What AWS services has Sidharth used?", "output": "He has used AWS EC2, S3, Lambda, DynamoDB, and Amplify across various projects including Convergence and e-slide."},
-    {"text": "Does Sidharth know AWS Amplify?", "output": "Yes, he used AWS Amplify along with GraphQL for Project e-slide, a presentation sharing platform."},
-    {"text": "What is Sidharth's experience with VPCs?", "output": "He designed secure VPCs based on AWS best practices for Project Convergence at Poumki Digital LLP."},
-    {"text": "Does Sidharth know about monitoring and logging?", "output": "Yes, he has implemented centralized logging using Azure Monitor for GRACE 2.0 and used Winston and LogLevel logging for full observability in Project Convergence."},
-    
-    # Additional AI/ML Skills
-    {"text": "What is HuggingFace?", "output": "HuggingFace is an AI/ML platform that Sidharth uses. It provides access to thousands of pre-trained models and is part of his AI toolkit."},
-    {"text": "What is Langchain?", "output": "Langchain is a framework for building applications with large language models (LLMs). Sidharth lists it in his AI/ML skills."},
-    {"text": "Does Sidharth know Gemini?", "output": "Yes, he integrated Google Gemini in GRACE 2.0 for file uploads and document processing capabilities."},
-    {"text": "What is Agentic AI?", "output": "Agentic AI refers to autonomous AI systems that can take actions. Sidharth lists it in his AI/ML skills, indicating experience with AI agents."},
-    {"text": "Does Sidharth know Azure AI?", "output": "Yes, Azure AI is part of his AI/ML skills. He uses various Azure AI services in his projects at KellyOCG."},
-    {"text": "What is the Perplexity API?", "output": "Sidharth implemented real-time web search using the Perplexity API in GRACE 2.0, enhancing the chatbot's response relevance."},
-    
-    # Additional Tools
-    {"text": "What is Cursor?", "output": "Cursor is an AI-assisted code editor that Sidharth uses. It's listed under his development tools alongside VS Code and Windsurf."},
-    {"text": "What is Windsurf?", "output": "Windsurf is an AI-assisted development tool that Sidharth uses for enhanced coding productivity."},
-    {"text": "Does Sidharth know Excel?", "output": "Yes, Microsoft Excel is listed in his tools. He uses it along with PowerPoint and Word for documentation and reporting."},
-    {"text": "What Microsoft Office tools does Sidharth use?", "output": "He uses Excel, PowerPoint, and Word for documentation, presentations, and data analysis."},
-    
-    # Other Skills
-    {"text": "Does Sidharth know GraphQL?", "output": "Yes, he used GraphQL with AWS Amplify for Project e-slide, a presentation sharing platform."},
-    {"text": "What is Socket.IO?", "output": "Socket.IO is a library for real-time communication. Sidharth used it to implement real-time user interactions in Project Convergence."},
-    
-    # KellyOCG Project Details
-    {"text": "What telemetry features did Sidharth implement?", "output": "He implemented Telemetry collection for PowerBI dashboards in GRACE Sync to monitor extension usage and performance metrics."},
-    {"text": "How did Sidharth optimize mobile experience?", "output": "In GRACE 2.0, he optimized mobile experience with dynamic textbox resizing, achieving 95% user satisfaction."},
-    {"text": "What is the prompt saving feature?", "output": "In GRACE 2.0, Sidharth implemented new prompt saving functionality in the UI, enabling users to easily store and reuse custom prompts."},
-    {"text": "Did Sidharth implement clipboard paste for images?", "output": "Yes, he implemented functionality to paste images directly from clipboard in GRACE 2.0 for improved user experience."},
-    {"text": "What codeblock improvements did Sidharth make?", "output": "He redesigned the codeblock component in GRACE 2.0 to enhance readability and user interaction with code snippets."},
-    {"text": "What security certifications did GRACE 2.0 achieve?", "output": "Sidharth achieved full Veracode compliance for GRACE 2.0 by fixing all high-severity vulnerabilities and implementing RBAC."},
-    {"text": "Does Sidharth handle penetration test feedback?", "output": "Yes, he led monthly UI/security updates based on penetration test feedback for GRACE 2.0."},
-    
-    # Poumki Project Details
-    {"text": "How did Sidharth reduce storage costs?", "output": "He connected Nexus with AWS S3 to reduce artifact storage costs by 30% for Project Convergence."},
-    {"text": "What test coverage did Project Convergence have?", "output": "Sidharth built a multilingual UI with 100% test coverage for Project Convergence."},
-    {"text": "What pagination features did Sidharth implement?", "output": "He implemented pagination and search functionality with frontend filters in Project Convergence to enhance user experience and data accessibility."},
-    {"text": "What user safety features did Sidharth add?", "output": "He implemented a ban user feature in Project e-slide to improve community safety."},
-    {"text": "What is React-i18next?", "output": "React-i18next is an internationalization framework. Sidharth used it to add multilingual support to Project e-slide and Izycourse."},
-    
-    # TCS Project Details
-    {"text": "What was Sidharth's ulcer detection model accuracy?", "output": "The ulcer detection prototype model he developed at TCS Rapid Labs achieved 92% precision."},
-    {"text": "What was the ticket prediction model accuracy?", "output": "The ticket prediction prototype model he built at TCS Rapid Labs achieved 85% accuracy."},
-    {"text": "Did Sidharth do any migration work?", "output": "Yes, he migrated an internally developed Django app to AngularJS at TCS Rapid Labs."},
-    {"text": "How much time did Sidharth's automation tools save?", "output": "His automation tools at TCS saved over 500 work hours annually, which earned him the 'Star of the Month' award."},
-    {"text": "What was the Auto Delegation Tool?", "output": "The Auto Delegation Tool was an automation tool Sidharth built at TCS to validate data discrepancies with different data sources, reducing manual effort by 40%."},
-    {"text": "How much time did the Core Analysis Tool save?", "output": "The Core Analysis Tool reduced incident resolution time by 30% at TCS by enabling root cause analysis for service incidents."},
-    
-    # Education Details
-    {"text": "What is Sidharth's MCA specialization?", "output": "His MCA is specialized in AI/ML (Artificial Intelligence and Machine Learning) at Amritha Vishwa Vidyapeetham."},
-    {"text": "Is Sidharth pursuing higher education?", "output": "Yes, he is currently pursuing a Master of Computer Applications (MCA) with AI/ML specialization at Amritha Vishwa Vidyapeetham."},
-    {"text": "When did Sidharth complete his BCA?", "output": "He completed his Bachelor of Computer Applications (BCA) from VLB Janakiammal College of Arts and Science, Coimbatore in September 2020."},
-    
-    # Language Details
-    {"text": "Does Sidharth speak Tamil?", "output": "Yes, he has conversational proficiency in Tamil."},
-    {"text": "How many languages does Sidharth speak?", "output": "He speaks four languages: Malayalam (Native), English (Professional Proficiency), Tamil (Conversational), and Hindi (Conversational)."},
-    {"text": "Is Sidharth from Kerala?", "output": "Yes, Sidharth E is from Kerala, India. Malayalam is his native language."},
-    
-    # Summary Questions
-    {"text": "Summarize Sidharth's skills", "output": "Sidharth's skills span: Frontend (React, Next.js, TypeScript, Tailwind), Backend (Node.js, Python, FastAPI), Databases (MongoDB, Cosmos DB), Cloud (Azure, AWS, Jenkins), AI/ML (OpenAI, Gemini, Langchain, HuggingFace), and Tools (Git, VS Code, Cursor)."},
-    {"text": "What is Sidharth's tech stack?", "output": "His primary stack includes React/Next.js for frontend, Node.js/Python for backend, MongoDB/Cosmos DB for databases, Azure/AWS for cloud, and OpenAI/Gemini for AI. He also uses TypeScript, Tailwind CSS, and modern DevOps tools."},
-    {"text": "List all of Sidharth's frontend skills", "output": "Frontend: HTML5/CSS/JS, TypeScript, React, Next.js, SASS, Tailwind CSS, AngularJS, Vue.js."},
-    {"text": "List all of Sidharth's backend skills", "output": "Backend: Node.js, ExpressJS, Python, FastAPI, Flask, Django."},
-    {"text": "List all of Sidharth's database skills", "output": "Databases: MongoDB, Azure Cosmos DB, AWS DynamoDB, PostgreSQL, MySQL."},
-    {"text": "List all of Sidharth's cloud skills", "output": "Cloud/DevOps: AWS, Azure, Jenkins, Nginx, Bicep, Linux, CI/CD Pipelines, AWS Amplify."},
-    {"text": "List all of Sidharth's AI skills", "output": "AI/ML: Agentic AI, Langchain, HuggingFace, MCP, GenAI, OpenAI, Google Gemini, Azure AI."},
-    {"text": "What projects has Sidharth worked on?", "output": "Key projects: GRACE Sync (AI browser extension), GRACE 2.0 (GenAI chat app), Project Convergence (data analytics), e-slide (presentations), Izycourse (e-learning), and healthcare AI prototypes at TCS."},
-    
-    # More Conversational
-    {"text": "Can you recommend Sidharth for a job?", "output": "Absolutely! Sidharth brings nearly 5 years of Full Stack experience, strong AI integration skills, and a track record of building impactful products. He's worked at TCS, Poumki Digital, and currently KellyOCG. Contact him at sidharthe38943@gmail.com."},
-    {"text": "What are Sidharth's career highlights?", "output": "Key highlights: Built AI browser extensions at KellyOCG, created ML models with 92% precision at TCS, implemented CI/CD saving 30% storage costs, won 'Star of the Month' for automation tools saving 500+ hours annually."},
-    {"text": "Tell me about Sidharth's achievements", "output": "Notable achievements: 'Star of the Month' award at TCS, 92% precision ML model, 95% user satisfaction for mobile UX, 100% test coverage for multilingual apps, full Veracode security compliance."},
-    {"text": "What is Sidharth best known for?", "output": "Sidharth is known for building AI-powered applications, including browser extensions with chatbots, and creating automation tools that save hundreds of work hours. He combines Full Stack skills with modern AI technologies."},
-    {"text": "Describe Sidharth in one sentence", "output": "Sidharth E is a Full Stack Developer from Kerala, India with nearly 5 years of experience specializing in React, Node.js, cloud platforms, and AI integrations."}
-]
+# --- DISTRIBUTED ---
+# Set by torchrun; a plain `python train.py` is a world of one
+def world_size():
+    return int(os.environ.get("WORLD_SIZE", 1))
+
+def local_rank():
+    return int(os.environ.get("LOCAL_RANK", 0))
+
+def local_world_size():
+    return int(os.environ.get("LOCAL_WORLD_SIZE", 1))
 
+# --- DATA ---
+# Q&A pairs are streamed from `dataset_path`, a JSONL or Parquet file (see qa_data.py)
 # Convert to Alpaca format (instruction + response) with EOS token
 # The <|end▁of▁sentence|> token tells the model when to STOP generating
 alpaca_prompt = """Below is an instruction that describes a task. Write a response that appropriately completes the request.
@@ -292,75 +61,655 @@ alpaca_prompt = """Below is an instruction that describes a task. Write a respon
 ### Response:
 {}<|end▁of▁sentence|>"""
 
-formatted_data = [{"text": alpaca_prompt.format(item["text"], item["output"])} for item in raw_data]
-dataset = Dataset.from_list(formatted_data)
-print(f"Training on {len(formatted_data)} examples")
+def formatted_texts(path):
+    """Alpaca-formatted training texts, produced lazily one record at a time"""
+    for item in iter_qa_pairs(path):
+        yield alpaca_prompt.format(item["text"], item["output"])
 
 # --- MODEL LOADING ---
-print("Loading model...")
-bnb_config = BitsAndBytesConfig(
-    load_in_4bit=True,
-    bnb_4bit_use_double_quant=True,
-    bnb_4bit_quant_type="nf4",
-    bnb_4bit_compute_dtype=torch.float16
-)
+def load_tokenizer():
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    tokenizer.pad_token = tokenizer.eos_token
+    # Pad on the right so real tokens keep positions 0..n-1
+    tokenizer.padding_side = "right"
+    return tokenizer
 
-model = AutoModelForCausalLM.from_pretrained(
-    model_id,
-    quantization_config=bnb_config,
-    device_map="auto",
-    use_cache=False
-)
-tokenizer = AutoTokenizer.from_pretrained(model_id)
-tokenizer.pad_token = tokenizer.eos_token
-
-# Prepare for LoRA
-model = prepare_model_for_kbit_training(model)
-config = LoraConfig(
-    r=16,
-    lora_alpha=32,
-    target_modules=["q_proj", "k_proj", "v_proj", "o_proj"],
-    lora_dropout=0.05,
-    bias="none",
-    task_type="CAUSAL_LM"
-)
-model = get_peft_model(model, config)
-
-# Tokenize
-def tokenize(element):
-    return tokenizer(
-        element["text"],
-        truncation=True,
-        max_length=512,
-        padding="max_length",
+def load_base_model(device="cuda", gradient_checkpointing=True):
+    """Load the frozen base model (4-bit on GPU, fp32 on CPU), ready for LoRA adapters"""
+    print(f"Loading model on {device}...")
+    if device == "cuda":
+        bnb_config = BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_use_double_quant=True,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_compute_dtype=compute_dtype
+        )
+
+        model = AutoModelForCausalLM.from_pretrained(
+            model_id,
+            quantization_config=bnb_config,
+            # One full copy per DDP process, on that process's GPU
+            device_map={"": local_rank()} if world_size() > 1 else "auto",
+            use_cache=False
+        )
+
+        # Prepare for LoRA
+        model = prepare_model_for_kbit_training(model, use_gradient_checkpointing=gradient_checkpointing)
+    else:
+        # bitsandbytes is CUDA-only; fp32 master weights, with bf16 autocast applied by the Trainer where supported
+        model = AutoModelForCausalLM.from_pretrained(
+            model_id,
+            torch_dtype=torch.float32,
+            low_cpu_mem_usage=True,
+            use_cache=False
+        )
+        if gradient_checkpointing:
+            # Non-reentrant checkpointing still reaches the LoRA weights although the frozen embeddings need no grad
+            model.gradient_checkpointing_enable(gradient_checkpointing_kwargs={"use_reentrant": False})
+            model.enable_input_require_grads()
+
+    return model
+
+def add_lora(model, r=16, lora_alpha=32, lora_dropout=0.05, adapter_name="default"):
+    """Wrap a base model from `load_base_model` with fresh LoRA adapters, or add another adapter to a PeftModel"""
+    config = LoraConfig(
+        r=r,
+        lora_alpha=lora_alpha,
+        target_modules=["q_proj", "k_proj", "v_proj", "o_proj"],
+        lora_dropout=lora_dropout,
+        bias="none",
+        task_type="CAUSAL_LM"
     )
+    if isinstance(model, PeftModel):
+        model.add_adapter(adapter_name, config)
+        return model
+    return get_peft_model(model, config, adapter_name=adapter_name)
+
+def build_model(device="cuda", gradient_checkpointing=True):
+    return add_lora(load_base_model(device, gradient_checkpointing))
+
+# --- TOKENIZE ---
+def build_shard(path, tokenizer, max_length=max_seq_length, batch_size=1000):
+    """Tokenize `path` once into a uint16 shard keyed by the file, template, tokenizer and max length; reuse it on later runs"""
+    key = content_hash(file_digest(path), alpaca_prompt, tokenizer.name_or_path, type(tokenizer).__name__,
+                       len(tokenizer), max_length)
+    shard_path = os.path.join(shard_dir, f"{key}.bin")
+    if os.path.exists(shard_path):
+        print(f"Using pre-tokenized shard: {shard_path}")
+        return TokenShard(shard_path)
+
+    # Texts are formatted and tokenized `batch_size` at a time and streamed straight into the shard.
+    # No padding here: batches are padded to their own longest sequence by the collator
+    def token_lists():
+        texts = formatted_texts(path)
+        while batch := list(itertools.islice(texts, batch_size)):
+            encoded = tokenizer(batch, truncation=True, max_length=max_length)
+            yield from encoded["input_ids"]
+
+    print(f"Tokenizing {path} into shard: {shard_path}")
+    write_shard(shard_path, token_lists(), len(tokenizer))
+    return TokenShard(shard_path)
+
+def load_dataset(tokenizer, path=dataset_path, max_length=max_seq_length, packing=False, val_fraction=0.0, seed=42):
+    """(train, validation) splits of the tokenized data; validation is None when `val_fraction` is 0.
+
+    With `packing`, each split's examples are concatenated into rows of up to `max_length` tokens.
+    """
+    shard = build_shard(path, tokenizer, max_length)
+    # A fixed shuffle so the held-out examples stay the same across runs and resumes
+    order = torch.randperm(len(shard), generator=torch.Generator().manual_seed(seed)).tolist()
+    num_val = round(len(shard) * val_fraction)
+    splits = [Subset(shard, sorted(order[num_val:])), Subset(shard, sorted(order[:num_val])) if num_val else None]
+    print(f"Training on {len(splits[0])} examples, validating on {num_val}")
+    if packing:
+        splits = [split and Dataset.from_list(pack_examples([example["input_ids"] for example in split], max_length))
+                  for split in splits]
+        print(f"Packed training examples into {len(splits[0])} sequences")
+    return tuple(splits)
+
+def example_lengths(dataset):
+    """Token count of each example; for shards (or subsets of one) read from the offsets without touching the tokens"""
+    if isinstance(dataset, TokenShard):
+        return dataset.lengths().tolist()
+    if isinstance(dataset, Subset) and isinstance(dataset.dataset, TokenShard):
+        return dataset.dataset.lengths()[dataset.indices].tolist()
+    return [len(example["input_ids"]) for example in dataset]
+
+# --- PADDING STATS ---
+class PaddingTracker:
+    """Wrap a data collator and count real vs pad tokens in the batches it builds"""
+    def __init__(self, collator):
+        self.collator = collator
+        self.examples = 0
+        self.real_tokens = 0
+        self.total_tokens = 0
+        # Per-batch (examples, real, total) counts, recorded once a consumer sets this to a deque
+        self.batches = None
+
+    def __call__(self, features):
+        batch = self.collator(features)
+        counts = (len(features), sum(len(feature["input_ids"]) for feature in features), batch["input_ids"].numel())
+        self.examples += counts[0]
+        self.real_tokens += counts[1]
+        self.total_tokens += counts[2]
+        if self.batches is not None:
+            self.batches.append(counts)
+        return batch
+
+    def padding_ratio(self):
+        return 1 - self.real_tokens / self.total_tokens if self.total_tokens else 0.0
+
+class PaddingRatioCallback(TrainerCallback):
+    """Add the share of pad tokens since the previous log line to each training log"""
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.last_real = 0
+        self.last_total = 0
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        if logs is None or "loss" not in logs:
+            return
+        real = self.tracker.real_tokens - self.last_real
+        total = self.tracker.total_tokens - self.last_total
+        if total:
+            logs["padding_ratio"] = round(1 - real / total, 4)
+        self.last_real, self.last_total = self.tracker.real_tokens, self.tracker.total_tokens
+
+    def on_evaluate(self, args, state, control, **kwargs):
+        # Evaluation batches are padded by the same collator; leave them out of the next training log
+        self.last_real, self.last_total = self.tracker.real_tokens, self.tracker.total_tokens
+
+    def on_train_end(self, args, state, control, **kwargs):
+        if state.is_world_process_zero:
+            print(f"Padding ratio: {self.tracker.padding_ratio():.1%} of tokens processed were padding")
+
+# --- PACKING ---
+def pack_examples(token_lists, max_length):
+    """First-fit-decreasing: group examples into bins whose total length fits in `max_length`"""
+    bins = []
+    for index in sorted(range(len(token_lists)), key=lambda i: -len(token_lists[i])):
+        length = len(token_lists[index])
+        for packed in bins:
+            if packed["length"] + length <= max_length:
+                packed["members"].append(index)
+                packed["length"] += length
+                break
+        else:
+            bins.append({"members": [index], "length": length})
+    return [
+        {
+            "input_ids": [token for i in packed["members"] for token in token_lists[i]],
+            "example_lengths": [len(token_lists[i]) for i in packed["members"]],
+        }
+        for packed in bins
+    ]
+
+class PackedCollator:
+    """Batch packed rows with per-example position ids and a block-diagonal causal attention mask"""
+    def __init__(self, pad_token_id, mask_dtype, pad_to_multiple_of=8):
+        self.pad_token_id = pad_token_id
+        self.mask_dtype = mask_dtype
+        self.pad_to_multiple_of = pad_to_multiple_of
+
+    def __call__(self, features):
+        longest = max(len(feature["input_ids"]) for feature in features)
+        width = -(-longest // self.pad_to_multiple_of) * self.pad_to_multiple_of
+        input_ids = torch.full((len(features), width), self.pad_token_id, dtype=torch.long)
+        labels = torch.full((len(features), width), -100, dtype=torch.long)
+        position_ids = torch.zeros((len(features), width), dtype=torch.long)
+        # Padding shares segment -1, so pad rows still attend to something and never produce NaNs
+        segments = torch.full((len(features), width), -1, dtype=torch.long)
+
+        for row, feature in enumerate(features):
+            offset = 0
+            for segment, length in enumerate(feature["example_lengths"]):
+                ids = torch.tensor(feature["input_ids"][offset:offset + length])
+                input_ids[row, offset:offset + length] = ids
+                # The first token of an example must not be predicted from the previous example
+                labels[row, offset + 1:offset + length] = ids[1:]
+                position_ids[row, offset:offset + length] = torch.arange(length)
+                segments[row, offset:offset + length] = segment
+                offset += length
+
+        # Token i may attend to token j only within the same example and when j <= i
+        causal = torch.tril(torch.ones(width, width, dtype=torch.bool))
+        allowed = (segments[:, :, None] == segments[:, None, :]) & causal
+        attention_mask = torch.zeros((len(features), 1, width, width), dtype=self.mask_dtype)
+        attention_mask.masked_fill_(~allowed[:, None], torch.finfo(self.mask_dtype).min)
+        return {
+            "input_ids": input_ids,
+            "labels": labels,
+            "position_ids": position_ids,
+            "attention_mask": attention_mask,
+        }
+
+# --- SHARED PREFIX ---
+class SharedPrefixCollator:
+    """Strip the shared preamble tokens from each example before collating the suffixes"""
+    def __init__(self, collator, prefix_ids):
+        self.collator = collator
+        self.prefix_ids = list(prefix_ids)
+
+    def __call__(self, features):
+        suffixes = []
+        for feature in features:
+            input_ids = list(feature["input_ids"])
+            if input_ids[:len(self.prefix_ids)] != self.prefix_ids:
+                raise ValueError("Example does not start with the shared preamble tokens")
+            suffixes.append({"input_ids": input_ids[len(self.prefix_ids):]})
+        return self.collator(suffixes)
+
+# --- MULTI-ADAPTER ---
+def load_adapter_specs(path):
+    """Adapters to train together: a JSON list of {"name", "dataset"} objects, optionally with
+    "adapter_dir" (default adapters/<name>), "r", "lora_alpha" and "lora_dropout"."""
+    with open(path) as f:
+        specs = json.load(f)
+    names = [spec["name"] for spec in specs]
+    if not names or len(set(names)) != len(names):
+        raise ValueError(f"{path} must list at least one adapter, with unique names")
+    return [{"adapter_dir": os.path.join("adapters", spec["name"]), **spec} for spec in specs]
+
+class MultiAdapterDataset(ConcatDataset):
+    """Every adapter's training examples back to back; each example carries the index of its adapter"""
+    def __getitem__(self, index):
+        return {**super().__getitem__(index), "adapter": bisect.bisect_right(self.cumulative_sizes, index)}
+
+class AdapterGroupedSampler(Sampler):
+    """Shuffled indices of a `MultiAdapterDataset` in which every run of `batch_size` belongs to one adapter.
+
+    Each adapter's last batch is topped up with repeats of its own examples so
+    no batch straddles two adapters. Within chunks of `mega_batches` batches,
+    examples are sorted by length to keep padding low, as group_by_length does.
+    The order of the batches themselves is shuffled, interleaving the adapters.
+    """
+    def __init__(self, dataset, batch_size, seed=42, mega_batches=50):
+        self.batch_size = batch_size
+        self.seed = seed
+        self.mega_batches = mega_batches
+        self.epoch = 0
+        starts = [0] + dataset.cumulative_sizes[:-1]
+        self.adapters = [(start, example_lengths(part)) for start, part in zip(starts, dataset.datasets)]
+
+    def __len__(self):
+        return sum(-(-len(lengths) // self.batch_size) for _, lengths in self.adapters) * self.batch_size
+
+    def __iter__(self):
+        # A new order every epoch, reproducible from the seed
+        generator = torch.Generator().manual_seed(self.seed + self.epoch)
+        self.epoch += 1
+        span = self.batch_size * self.mega_batches
+        batches = []
+        for start, lengths in self.adapters:
+            order = torch.randperm(len(lengths), generator=generator).tolist()
+            order += list(itertools.islice(itertools.cycle(order), -len(order) % self.batch_size))
+            for offset in range(0, len(order), span):
+                chunk = sorted(order[offset:offset + span], key=lambda i: -lengths[i])
+                batches += [[start + i for i in chunk[j:j + self.batch_size]] for j in range(0, len(chunk), self.batch_size)]
+        for index in torch.randperm(len(batches), generator=generator).tolist():
+            yield from batches[index]
 
-tokenized_dataset = dataset.map(tokenize, batched=True)
+class AdapterCollator:
+    """Collate one adapter's examples and tag the batch with that adapter's index"""
+    def __init__(self, collator):
+        self.collator = collator
+
+    def __call__(self, features):
+        adapters = {feature["adapter"] for feature in features}
+        if len(adapters) != 1:
+            raise ValueError("A batch mixes examples of several adapters")
+        batch = self.collator([{key: value for key, value in feature.items() if key != "adapter"} for feature in features])
+        # A plain int stays on the host when the Trainer moves the batch to the device
+        batch["adapter"] = adapters.pop()
+        return batch
+
+# --- TRAINER ---
+class CausalLMTrainer(Trainer):
+    """Trainer with two optional changes to the causal-LM forward/loss.
+
+    `prefix_ids`: encode the preamble once per batch and run forward/backward
+    only over each example's suffix. The preamble forward runs with gradients
+    (LoRA on k/v changes its keys and values), then its cache is repeated across
+    the batch. The loss covers suffix tokens only; the first suffix token is not
+    a target because its prediction comes from the preamble's last position.
+
+    `loss_chunk_tokens`: the lm_head is bypassed in the forward pass and the loss
+    is computed from the final hidden states a chunk of positions at a time (see
+    chunked_loss.py), so full-vocabulary logits are never materialized.
+
+    `adapter_names`: train several LoRA adapters of one PeftModel together. The
+    training set is a `MultiAdapterDataset`; batches hold one adapter's examples
+    and each micro-batch activates its adapter before the forward, so only that
+    adapter's weights get gradients and are updated. Training logs add a
+    `loss_<name>` per adapter.
+    """
+    def __init__(self, *args, prefix_ids=None, loss_chunk_tokens=None, adapter_names=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prefix_ids = torch.tensor([prefix_ids]) if prefix_ids is not None else None
+        self.loss_chunk_tokens = loss_chunk_tokens
+        self.lm_head = install_hidden_states_head(self.model) if loss_chunk_tokens else None
+        self.adapter_names = adapter_names
+        self.adapter_losses = {}
+
+    def _get_train_sampler(self, *args, **kwargs):
+        if self.adapter_names is not None:
+            return AdapterGroupedSampler(self.train_dataset, self.args.train_batch_size, self.args.seed)
+        if groups_by_length(self.args):
+            # Lengths up front, so the sampler does not load every example just to measure it
+            return LengthGroupedSampler(self.args.train_batch_size * self.args.gradient_accumulation_steps,
+                                        lengths=example_lengths(self.train_dataset))
+        return super()._get_train_sampler(*args, **kwargs)
+
+    def create_optimizer(self, *args, **kwargs):
+        if self.adapter_names is not None and self.optimizer is None:
+            # set_adapter() leaves only the active adapter trainable; the optimizer must hold every adapter's
+            # weights. Inactive ones get no gradient in a step, and AdamW skips parameters without one
+            for name, param in self.model.named_parameters():
+                if "lora_" in name:
+                    param.requires_grad_(True)
+        return super().create_optimizer(*args, **kwargs)
+
+    def compute_loss(self, model, inputs, return_outputs=False, num_items_in_batch=None):
+        if self.adapter_names is None:
+            return self.causal_lm_loss(model, inputs, return_outputs, num_items_in_batch)
+
+        inputs = dict(inputs)
+        name = self.adapter_names[inputs.pop("adapter")]
+        self.accelerator.unwrap_model(model).set_adapter(name)
+        result = self.causal_lm_loss(model, inputs, return_outputs, num_items_in_batch)
+        if model.training:
+            loss = result[0] if return_outputs else result
+            total, count = self.adapter_losses.get(name, (0.0, 0))
+            self.adapter_losses[name] = (total + loss.detach().float(), count + 1)
+        return result
+
+    def log(self, logs, *args, **kwargs):
+        if "loss" in logs:
+            for name, (total, count) in self.adapter_losses.items():
+                logs[f"loss_{name}"] = round(total.item() / count, 4)
+            self.adapter_losses = {}
+        super().log(logs, *args, **kwargs)
+
+    def _load_from_checkpoint(self, resume_from_checkpoint, *args, **kwargs):
+        super()._load_from_checkpoint(resume_from_checkpoint, *args, **kwargs)
+        # Early stopping picks up its best adapter and patience count from the same checkpoint
+        for callback in self.callback_handler.callbacks:
+            if hasattr(callback, "load_checkpoint"):
+                callback.load_checkpoint(resume_from_checkpoint)
+
+    def causal_lm_loss(self, model, inputs, return_outputs=False, num_items_in_batch=None):
+        if self.prefix_ids is None and self.lm_head is None:
+            return super().compute_loss(model, inputs, return_outputs, num_items_in_batch)
+
+        inputs = dict(inputs)
+        labels = inputs.pop("labels")
+        if self.prefix_ids is not None:
+            inputs = self.attach_prefix(model, inputs)
+        loss_kwargs = {}
+        if num_items_in_batch is not None and getattr(self, "model_accepts_loss_kwargs", False):
+            loss_kwargs["num_items_in_batch"] = num_items_in_batch
+
+        if self.lm_head is None:
+            outputs = model(**inputs, labels=labels, **loss_kwargs)
+            loss = outputs.loss
+        else:
+            with self.lm_head.bypass():
+                outputs = model(**inputs)
+            # `logits` holds the final hidden states here
+            loss = chunked_causal_lm_loss(outputs.logits, self.lm_head.weight, labels, self.loss_chunk_tokens,
+                                          bias=self.lm_head.bias, **loss_kwargs)
+        return (loss, outputs) if return_outputs else loss
+
+    def attach_prefix(self, model, inputs):
+        """Run the shared preamble and return suffix inputs that continue from its cache"""
+        input_ids = inputs["input_ids"]
+        batch_size, suffix_length = input_ids.shape
+        prefix_ids = self.prefix_ids.to(input_ids.device)
+        prefix_length = prefix_ids.shape[1]
+
+        cache = DynamicCache()
+        # Unwrapped so a DDP wrapper only sees one forward per backward; gradients still reach the LoRA weights
+        self.accelerator.unwrap_model(model)(input_ids=prefix_ids, past_key_values=cache, use_cache=True)
+        cache.batch_repeat_interleave(batch_size)
+
+        attention_mask = torch.cat([inputs["attention_mask"].new_ones(batch_size, prefix_length), inputs["attention_mask"]], dim=1)
+        position_ids = torch.arange(prefix_length, prefix_length + suffix_length, device=input_ids.device).expand(batch_size, -1)
+        return {
+            "input_ids": input_ids,
+            "attention_mask": attention_mask,
+            "position_ids": position_ids,
+            "past_key_values": cache,
+            "use_cache": True,
+        }
 
 # --- TRAIN ---
-if __name__ == "__main__":
-    print("Starting Training...")
-    trainer = Trainer(
+# transformers 5 replaced TrainingArguments.group_by_length with train_sampling_strategy
+SAMPLING_STRATEGY = "train_sampling_strategy" in {field.name for field in dataclasses.fields(TrainingArguments)}
+
+def length_grouping_kwargs(enabled):
+    """TrainingArguments keywords turning length-grouped batching on or off, for transformers 4.x or 5.x"""
+    if SAMPLING_STRATEGY:
+        return {"train_sampling_strategy": "group_by_length" if enabled else "random"}
+    return {"group_by_length": enabled}
+
+def groups_by_length(args):
+    if SAMPLING_STRATEGY:
+        return args.train_sampling_strategy == "group_by_length"
+    return args.group_by_length
+
+def build_trainer(model, tokenizer, dataset, eval_dataset=None, output_dir=output_dir, epochs=15, learning_rate=2e-4,
+                  batch_size=4, packing=False, shared_prefix=False, device="cuda", precision=compute_dtype, ddp_backend=None,
+                  save_steps=0, save_total_limit=2, eval_steps=50, patience=3, profile_window=None, loss_chunk_mb=64,
+                  adapter_names=None, step_phases=False):
+    """A Trainer with the collator, loss and arguments matching the packing/shared-prefix mode.
+
+    `precision` is the autocast dtype: float16 or bfloat16 for mixed precision, float32 to train without autocast.
+    `loss_chunk_mb` bounds the logits memory of the chunked loss; None computes the loss from full logits.
+    `step_phases` splits each step's time into phases in the step metrics (synchronizes the GPU several times a step).
+    `adapter_names` trains those adapters of `model` together on a `MultiAdapterDataset` (no checkpoints).
+    """
+    if packing and shared_prefix:
+        raise ValueError("packing and shared_prefix cannot be combined")
+
+    if packing:
+        padding_tracker = PaddingTracker(PackedCollator(tokenizer.pad_token_id, precision))
+        data_collator = padding_tracker
+    else:
+        # Pad each batch to its longest sequence, rounded up to a multiple of 8 for tensor-core friendly shapes
+        padding_tracker = PaddingTracker(DataCollatorForLanguageModeling(tokenizer, mlm=False, pad_to_multiple_of=8))
+        data_collator = padding_tracker
+
+    prefix_ids = None
+    if shared_prefix:
+        # Everything before the question is identical for every example
+        prefix_ids = tokenizer(alpaca_prompt.split("{}")[0])["input_ids"]
+        data_collator = SharedPrefixCollator(padding_tracker, prefix_ids)
+    if adapter_names is not None:
+        data_collator = AdapterCollator(data_collator)
+    loss_chunk_tokens = chunk_tokens_for_budget(len(tokenizer), loss_chunk_mb) if loss_chunk_mb else None
+
+    best_adapter = BestAdapterCallback(patience) if eval_dataset is not None else None
+    callbacks = [
+        PaddingRatioCallback(padding_tracker),
+        StepMetricsCallback(padding_tracker, phases=step_phases),
+    ]
+    # Before the checkpoint callback, so a checkpoint taken after an evaluation includes its result
+    if best_adapter is not None:
+        callbacks.append(best_adapter)
+    if adapter_names is None:
+        # Checkpoints hold a single adapter
+        callbacks.append(AsyncCheckpointCallback(save_steps, save_total_limit, best_adapter))
+    if profile_window is not None:
+        callbacks.append(ProfilerCallback(profile_window))
+
+    return CausalLMTrainer(
         model=model,
-        train_dataset=tokenized_dataset,
+        train_dataset=dataset,
+        eval_dataset=eval_dataset,
         args=TrainingArguments(
-            output_dir="outputs_backup",
-            per_device_train_batch_size=1,
-            gradient_accumulation_steps=4,
-            num_train_epochs=15,  # More epochs for small dataset
-            learning_rate=2e-4,   # TinyLlama can handle higher LR
+            output_dir=output_dir,
+            per_device_train_batch_size=batch_size,  # Same effective batch as 1 x 4 accumulation
+            per_device_eval_batch_size=batch_size,
+            gradient_accumulation_steps=1,
+            # The packed collator needs `example_lengths`, the adapter collator `adapter`
+            remove_unused_columns=not packing and adapter_names is None,
+            **length_grouping_kwargs(not packing),  # Bucket similar lengths so batches carry little padding
+            num_train_epochs=epochs,  # Upper bound when validating; early stopping usually ends sooner
+            eval_strategy="steps" if eval_dataset is not None else "no",
+            eval_steps=eval_steps,
+            prediction_loss_only=True,  # Evaluation only needs the loss; don't gather full-vocabulary logits
+            learning_rate=learning_rate,   # TinyLlama can handle higher LR
             warmup_steps=10,      # Warmup for stable training
-            fp16=True,
+            fp16=precision == torch.float16,
+            bf16=precision == torch.bfloat16,
+            use_cpu=device == "cpu",
+            ddp_backend=ddp_backend,
+            ddp_find_unused_parameters=False,  # Every LoRA weight gets a gradient; skip DDP's per-step graph walk
             logging_steps=5,
-            optim="paged_adamw_8bit",
-            save_strategy="no",
+            optim="paged_adamw_8bit" if device == "cuda" else "adamw_torch",  # bitsandbytes' paged optimizer needs CUDA
+            save_strategy="no",   # Adapter-only checkpoints are written by AsyncCheckpointCallback
             weight_decay=0.01,    # Prevent overfitting
         ),
-        data_collator=DataCollatorForLanguageModeling(tokenizer, mlm=False),
+        data_collator=data_collator,
+        callbacks=callbacks,
+        prefix_ids=prefix_ids,
+        loss_chunk_tokens=loss_chunk_tokens,
+        adapter_names=adapter_names,
+    )
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fine-tune TinyLlama with LoRA on the Q&A dataset")
+    parser.add_argument("--dataset", default=dataset_path, help="JSONL or Parquet file of text/output pairs")
+    parser.add_argument("--output-dir", default=output_dir, help="Trainer output directory")
+    parser.add_argument("--adapter-dir", default=adapter_dir, help="Where to save the trained adapter")
+    parser.add_argument("--epochs", type=float, default=15)
+    parser.add_argument("--learning-rate", type=float, default=2e-4)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--max-seq-length", type=int, default=max_seq_length)
+    parser.add_argument("--device", choices=["auto", "cuda", "cpu"], default="auto",
+                        help="Training backend (auto picks CUDA when available)")
+    parser.add_argument("--dtype", choices=["auto", *DTYPES], default="auto",
+                        help="Autocast dtype (auto: float16 on GPU, bfloat16 on CPUs with native support, else float32)")
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads, pinned to that many cores (default: all)")
+    parser.add_argument("--interop-threads", type=int, default=None, help="CPU inter-op threads (default: 1)")
+    parser.add_argument("--gradient-checkpointing", action=argparse.BooleanOptionalAction, default=None,
+                        help="Recompute activations in backward to save memory (default: on for GPU, off for CPU)")
+    parser.add_argument("--val-fraction", type=float, default=0.0,
+                        help="Share of Q&A pairs held out for validation and early stopping; the adapter never "
+                             "learns held-out pairs (default 0: train on everything for the full --epochs)")
+    parser.add_argument("--eval-steps", type=int, default=50, help="Compute the validation loss every N steps")
+    parser.add_argument("--patience", type=int, default=3,
+                        help="Stop after this many evaluations without a new best validation loss")
+    parser.add_argument("--save-steps", type=int, default=50,
+                        help="Write an adapter-only checkpoint to the output directory every N steps (0: never)")
+    parser.add_argument("--save-total-limit", type=int, default=2, help="Checkpoints to keep (0: keep all)")
+    parser.add_argument("--resume", nargs="?", const="latest", default=None,
+                        help="Resume from a checkpoint directory, or from the newest one in the output directory")
+    parser.add_argument("--ddp-backend", choices=["gloo", "nccl"], default=None,
+                        help="Process group backend under torchrun (default: nccl on GPU, gloo on CPU)")
+    parser.add_argument("--loss-chunk-mb", type=int, default=64,
+                        help="Compute the loss in chunks whose fp32 logits take about this many MB (0: full logits)")
+    parser.add_argument("--adapters", default=None, metavar="SPEC.json",
+                        help="Train several adapters over one base model, one dataset each (see README); "
+                             "replaces --dataset/--adapter-dir and trains without validation or checkpoints")
+    parser.add_argument("--step-phases", action=argparse.BooleanOptionalAction, default=None,
+                        help="Time data/forward/backward/optimizer per step; on GPU this synchronizes several times "
+                             "a step (default: on for CPU, off for GPU)")
+    add_profile_arguments(parser)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--packing", action="store_true",
+                      help="Concatenate several examples into each sequence, with attention kept inside each example")
+    mode.add_argument("--shared-prefix", action="store_true",
+                      help="Run the constant Alpaca preamble once per batch and train only on each example's suffix")
+    args = parser.parse_args(argv)
+    if args.adapters and args.resume:
+        parser.error("--adapters runs cannot be resumed")
+    if args.adapters and world_size() > 1:
+        # Switching adapters changes which weights require gradients, which DDP's fixed gradient buckets cannot follow
+        parser.error("--adapters needs a single process")
+    return args
+
+def main():
+    args = parse_args()
+    device = select_device(args.device)
+    precision = select_dtype(device, args.dtype)
+    ddp_backend = args.ddp_backend or ("nccl" if device == "cuda" else "gloo")
+    # Joins the torchrun process group (a no-op single process otherwise); the Trainer reuses it
+    state = PartialState(cpu=device == "cpu", backend=ddp_backend if world_size() > 1 else None)
+    if device == "cpu":
+        # Processes on one host split its cores into disjoint blocks instead of oversubscribing them
+        threads = args.threads or max(1, usable_cores() // local_world_size())
+        if threads * local_world_size() > usable_cores():
+            raise ValueError(f"{local_world_size()} process(es) x {threads} threads need more than the "
+                             f"{usable_cores()} usable cores; lower --threads or the number of processes")
+        cores = pin_cpu_cores(threads, offset=local_rank() * threads)
+        intra_op, inter_op = configure_cpu_threads(threads, args.interop_threads)
+        print(f"CPU threads: {intra_op} intra-op, {inter_op} inter-op" + (f", pinned to cores {cores}" if cores else ""))
+
+    gradient_checkpointing = args.gradient_checkpointing
+    if gradient_checkpointing is None:
+        # Checkpointing trades ~30% more compute for memory; CPU hosts rarely need the trade
+        gradient_checkpointing = device == "cuda" and not args.shared_prefix
+    elif gradient_checkpointing and args.shared_prefix:
+        # Recomputing layers during backward would append to the shared preamble cache twice
+        raise ValueError("--shared-prefix cannot be combined with --gradient-checkpointing")
+
+    tokenizer = load_tokenizer()
+    # One process per host tokenizes; the others wait and then memory-map the same shard
+    with state.local_main_process_first():
+        if args.adapters:
+            specs = load_adapter_specs(args.adapters)
+            dataset = MultiAdapterDataset([load_dataset(tokenizer, spec["dataset"], args.max_seq_length, args.packing)[0]
+                                           for spec in specs])
+            eval_dataset = None
+        else:
+            dataset, eval_dataset = load_dataset(tokenizer, args.dataset, args.max_seq_length, args.packing, args.val_fraction)
+
+    if args.adapters:
+        # One frozen base; every micro-batch runs through it with its own adapter switched on
+        model = load_base_model(device, gradient_checkpointing)
+        for spec in specs:
+            model = add_lora(model, adapter_name=spec["name"],
+                             **{key: spec[key] for key in ("r", "lora_alpha", "lora_dropout") if key in spec})
+        print("Training adapters: " + ", ".join(f"{spec['name']} ({len(part)} examples)"
+                                                for spec, part in zip(specs, dataset.datasets)))
+    else:
+        model = build_model(device, gradient_checkpointing)
+    trainer = build_trainer(
+        model, tokenizer, dataset, eval_dataset, output_dir=args.output_dir, epochs=args.epochs, learning_rate=args.learning_rate,
+        batch_size=args.batch_size, packing=args.packing, shared_prefix=args.shared_prefix,
+        device=device, precision=precision, ddp_backend=ddp_backend if world_size() > 1 else None,
+        save_steps=args.save_steps, save_total_limit=args.save_total_limit, eval_steps=args.eval_steps,
+        patience=args.patience,
+        loss_chunk_mb=args.loss_chunk_mb,
+        profile_window=ProfilerWindow.from_args(args, f"train-rank{state.process_index}" if world_size() > 1 else "train"),
+        adapter_names=[spec["name"] for spec in specs] if args.adapters else None,
+        # Timing CPU phases costs nothing; on GPU it needs synchronization
+        step_phases=device == "cpu" if args.step_phases is None else args.step_phases,
     )
-    
-    trainer.train()
-    
-    print("Saving adapter...")
-    model.save_pretrained("Sidharth_AI_Model")
-    print("Done!")
\ No newline at end of file
+
+    resume_from = latest_checkpoint(args.output_dir) if args.resume == "latest" else args.resume
+    if args.resume and resume_from is None:
+        print(f"No checkpoint found in {args.output_dir}, starting from scratch")
+    elif resume_from:
+        print(f"Resuming from: {resume_from}")
+
+    print(f"Starting Training on {device} ({str(precision).replace('torch.', '')})...")
+    metrics = trainer.train(resume_from_checkpoint=resume_from).metrics
+    if not state.is_main_process:
+        return
+    # Samples/s counts every process's batches
+    print(f"⚡ Throughput: {metrics['train_samples_per_second']:.2f} samples/s over {metrics['train_runtime']:.0f}s"
+          f" on {state.num_processes} process(es)")
+
+    if args.adapters:
+        for spec in specs:
+            print(f"Saving adapter {spec['name']} to {spec['adapter_dir']}...")
+            save_adapter(model, spec["name"], spec["adapter_dir"])
+    else:
+        print("Saving adapter...")
+        model.save_pretrained(args.adapter_dir)
+    print("Done!")
+
+if __name__ == "__main__":
+    main()